@@ -11,15 +11,133 @@ import numpy
 
 PRINT_RESULTS = False
 
+# Maximum number of (step, landmark) pairs the vectorized simulation handles in one go. Keeps temporary arrays small.
+SIMULATION_BLOCK_SIZE = 1000000
+
+# Horizontal field of view of the NAO camera (same value as in Distance and Vision)
+CAMERA_H_FOV = 46.4 * math.pi / 180.0
+
+# From this many landmarks on, the simulation looks up landmarks in a LandmarkGrid instead of checking all of them
+GRID_MIN_LANDMARKS = 100
+
 def rand_minus1_plus1():
     """ returns a random number between -1.0 and 1.0 """
     return random.random() * 2.0 - 1.0
 
+def make_random_generator(seed = None):
+    """
+    Returns a numpy random generator seeded with seed. That is a numpy.random.Generator where numpy has it
+    (numpy 1.17 and later), and a numpy.random.RandomState on older numpy (which is what the robot runs).
+    We only use uniform(), which works the same on both.
+    """
+    if hasattr(numpy.random, 'default_rng'):
+        return numpy.random.default_rng(seed)
+    return numpy.random.RandomState(seed)
+
+def measurements_to_lists(measurement_table, num_steps, first_step = 0):
+    """
+    Turns a measurement table with rows [step, distance, relative angle, post] (sorted on step) back into
+    the measurement format the SLAM algorithms get: result[i] = list of [distance, relative angle, post]
+    measured at step first_step + i
+    """
+    bounds = numpy.searchsorted(measurement_table[:, 0], numpy.arange(first_step, first_step + num_steps + 1)).tolist()
+    rows = [[distance, angle, post != 0.0] for (distance, angle, post) in measurement_table[:, 1:].tolist()]
+    return [rows[bounds[i]:bounds[i + 1]] for i in xrange(num_steps)]
+
+class LandmarkGrid:
+    '''
+    Static uniform grid over landmark positions, for visibility queries in big worlds.
+    
+    Landmark indices are sorted on cell, and order[cell_start[c]:cell_start[c+1]] are the landmarks in cell c
+    (cells numbered cx * ny + cy). Cells with the same cx and consecutive cy are next to each other in order,
+    so every column of cells a query box covers is one slice of order. A query costs about as much as the
+    number of landmarks in the box, rather than the number of landmarks in the world.
+    '''
+    
+    def __init__(self, landmarks, cell_size):
+        self.landmarks = landmarks
+        self.requested_cell_size = cell_size
+        if len(landmarks) == 0:
+            self.origin = numpy.zeros(2)
+            extent = numpy.zeros(2)
+        else:
+            self.origin = landmarks.min(0)
+            extent = landmarks.max(0) - self.origin
+        # Makes sure a sparse world does not get a huge empty grid
+        while (int(extent[0] // cell_size) + 1) * (int(extent[1] // cell_size) + 1) > max(1024, 4 * len(landmarks)):
+            cell_size *= 2
+        self.cell_size = cell_size
+        self.nx = int(extent[0] // cell_size) + 1
+        self.ny = int(extent[1] // cell_size) + 1
+        cells = self.column_of(landmarks[:, 0]) * self.ny + self.row_of(landmarks[:, 1])
+        self.order = numpy.argsort(cells, kind = 'mergesort')
+        self.cell_start = numpy.searchsorted(cells[self.order], numpy.arange(self.nx * self.ny + 1))
+    
+    def column_of(self, x):
+        # Points outside the grid get clipped to the border cells, all landmarks are inside anyway
+        return numpy.clip(numpy.floor((x - self.origin[0]) / self.cell_size), 0, self.nx - 1).astype(int)
+    
+    def row_of(self, y):
+        return numpy.clip(numpy.floor((y - self.origin[1]) / self.cell_size), 0, self.ny - 1).astype(int)
+    
+    def candidates(self, x_min, y_min, x_max, y_max):
+        '''
+        For arrays describing query boxes returns arrays (boxes, landmarks) with one entry for every landmark
+        in a cell which overlaps box i. This includes every landmark inside the box.
+        '''
+        cx_min = self.column_of(x_min)
+        cx_max = self.column_of(x_max)
+        cy_min = self.row_of(y_min)
+        cy_max = self.row_of(y_max)
+        # one slice of order for every (box, column of cells) pair
+        columns = cx_max - cx_min + 1
+        boxes = numpy.repeat(numpy.arange(len(x_min)), columns)
+        cx = numpy.repeat(cx_min - numpy.cumsum(columns) + columns, columns) + numpy.arange(columns.sum())
+        starts = self.cell_start[cx * self.ny + cy_min[boxes]]
+        counts = self.cell_start[cx * self.ny + cy_max[boxes] + 1] - starts
+        # expand every slice into its landmarks without looping
+        first = numpy.cumsum(counts) - counts
+        within = numpy.arange(counts.sum()) - numpy.repeat(first, counts)
+        landmarks = self.order[numpy.repeat(starts, counts) + within]
+        return [numpy.repeat(boxes, counts), landmarks]
+    
+    def candidates_in_view(self, x, y, theta, radius, field_of_view = None):
+        '''
+        Candidates (see candidates) for what robots at poses (x, y, theta) can see within radius, looking only
+        at the bounding box of the view cone instead of the whole circle when field_of_view is less than pi.
+        '''
+        if field_of_view is None or field_of_view >= math.pi:
+            return self.candidates(x - radius, y - radius, x + radius, y + radius)
+        half = field_of_view / 2
+        # Bounding box of a cone: its apex, both edges, and the points on the arc straight
+        # left/right/up/down of the apex if those directions are inside the cone.
+        xs = [x, x + radius * numpy.cos(theta - half), x + radius * numpy.cos(theta + half)]
+        ys = [y, y + radius * numpy.sin(theta - half), y + radius * numpy.sin(theta + half)]
+        for direction in (0.0, math.pi / 2, math.pi, -math.pi / 2):
+            inside = numpy.abs((direction - theta + math.pi) % (2 * math.pi) - math.pi) <= half
+            xs.append(numpy.where(inside, x + radius * math.cos(direction), x))
+            ys.append(numpy.where(inside, y + radius * math.sin(direction), y))
+        xs = numpy.array(xs)
+        ys = numpy.array(ys)
+        return self.candidates(xs.min(0), ys.min(0), xs.max(0), ys.max(0))
+
 class AbstractSLAMProblem:
     
     def __init__(self, world_size = 100.0, measurement_range = 30.0, motion_noise = 1.0, 
-                 measurement_noise = 1.0, num_landmarks = 0, initialX = 0, initialY = 0, initialTheta = 0):
-        """ Construct an Abstract SLAM Problem world """
+                 measurement_noise = 1.0, num_landmarks = 0, initialX = 0, initialY = 0, initialTheta = 0, seed = None,
+                 field_of_view = None):
+        """ 
+        Construct an Abstract SLAM Problem world 
+        
+        seed seeds the numpy generator used by make_landmarks, sense and the vectorized simulation,
+        so worlds and runs can be reproduced. None gives a different world every time.
+        
+        field_of_view (radians, for example CAMERA_H_FOV) limits what the vectorized simulation can measure to 
+        landmarks at most field_of_view/2 left or right of where the robot is facing. None means all around.
+        """
+        self.rng = make_random_generator(seed)
+        self.field_of_view = field_of_view
+        self.landmark_grid = None
         self.world_size = world_size
         self.measurement_range = measurement_range
         self.x = initialX
@@ -36,10 +154,8 @@ class AbstractSLAMProblem:
         
     def make_landmarks(self, num_landmarks):
         """ Randomly places a given number of landmarks in the world """
-        self.landmarks = numpy.zeros((num_landmarks, 2))
-        for i in xrange(num_landmarks):
-            self.landmarks[i] = [round(rand_minus1_plus1() * self.world_size/2),
-                                   round(rand_minus1_plus1() * self.world_size/2)]
+        self.landmarks = numpy.round(self.rng.uniform(-1.0, 1.0, (num_landmarks, 2)) * self.world_size/2)
+        self.landmark_grid = None
 
         self.num_landmarks = num_landmarks
         
@@ -70,15 +186,32 @@ class AbstractSLAMProblem:
         dx = x_landmark - x_robot + noise
         dy = y_landmark - y_robot + noise
         
+        Only landmarks within field_of_view (if set) of where the robot is facing are observed. From
+        GRID_MIN_LANDMARKS landmarks on, the landmarks close to the robot are looked up in a LandmarkGrid.
+        Noise is drawn for the reachable landmarks in index order either way, so a seed gives the same
+        measurements with and without the grid.
         """
+        indices = numpy.arange(self.num_landmarks)
+        if self.measurement_range >= 0.0:
+            # noise moves dx and dy by at most measurement_noise each, so nothing further away can be in range
+            reach = self.measurement_range + 2 * abs(self.measurement_noise)
+            if self.num_landmarks >= GRID_MIN_LANDMARKS and reach > 0:
+                grid = self.get_landmark_grid(self.num_landmarks, reach / 2)
+                [boxes, indices] = grid.candidates_in_view(numpy.array([self.x]), numpy.array([self.y]), 
+                                                           numpy.array([self.theta]), reach, self.field_of_view)
+                indices = numpy.sort(indices)
+            d = self.landmarks[indices] - [self.x, self.y]
+            indices = indices[numpy.abs(d).sum(1) <= reach]
+        d = self.landmarks[indices] - [self.x, self.y]
+        indices = indices[self.in_field_of_view(numpy.arctan2(d[:, 1], d[:, 0]) - self.theta)]
         
-        Z = []
-        for i in range(self.num_landmarks):
-            dx = self.landmarks[i][0] - self.x + self.rand_minus1_plus1() * self.measurement_noise
-            dy = self.landmarks[i][1] - self.y + self.rand_minus1_plus1() * self.measurement_noise    
-            if self.measurement_range < 0.0 or abs(dx) + abs(dy) <= self.measurement_range:
-                Z.append([i, dx, dy])
-        return Z
+        noise = self.rng.uniform(-1.0, 1.0, (len(indices), 2)) * self.measurement_noise
+        d = self.landmarks[indices] - [self.x, self.y] + noise
+        if self.measurement_range >= 0.0:
+            observed = numpy.abs(d).sum(1) <= self.measurement_range
+            indices = indices[observed]
+            d = d[observed]
+        return [[i, dx, dy] for (i, dx, dy) in zip(indices.tolist(), d[:, 0].tolist(), d[:, 1].tolist())]
     
     def run_simulation_dennis(self, num_steps, num_landmarks, world_size, 
                               measurement_range, motion_noise, measurement_noise, distance):
@@ -149,6 +282,191 @@ class AbstractSLAMProblem:
                 print ""
                 
         return [self.true_robot_positions, self.landmarks, self.observed_motions, self.observed_measurements]
+    
+    def simulate_block(self, num_steps, num_landmarks, measurement_range, motion_noise, measurement_noise, distance):
+        '''
+        Vectorized version of the loop in run_simulation_dennis: same robot behaviour and same measurement model,
+        but all randomness is drawn from self.rng at once and all landmarks are measured in one numpy operation.
+        Continues from (and updates) the current robot pose, does not store anything.
+        
+        Returns [poses, motions, measurement_table] as numpy arrays where
+            poses[i] = [x, y, theta] after step i
+            motions[i] = [time, action, dForwards, dSideways, dtheta, speed] as send to SLAM
+            measurement_table[k] = [i, distance, relative angle, post] for every landmark measured at step i
+        '''
+        d = distance * (1 + motion_noise * self.rng.uniform(-1.0, 1.0, num_steps))
+        turns = self.rng.uniform(-1.0, 1.0, num_steps) * math.pi
+        
+        poses = numpy.zeros((num_steps, 3))
+        motions = numpy.zeros((num_steps, 6))
+        
+        # The walk itself depends on the previous position (turning around at the border), so it stays a loop.
+        # It is cheap though, measuring the landmarks is the expensive part.
+        x = self.x
+        y = self.y
+        theta = self.theta
+        half_world = self.world_size/2
+        d_list = d.tolist()
+        turns_list = turns.tolist()
+        for i in xrange(num_steps):
+            dx = math.cos(theta) * d_list[i]
+            dy = math.sin(theta) * d_list[i]
+            if(abs(x + dx) > half_world or abs(y + dy) > half_world):
+                # movement would result in moving out of the world, so instead we turn around 180 degrees, and dont move
+                theta += math.pi
+                motions[i, 4] = math.pi
+            else:
+                x += dx
+                y += dy
+                theta += turns_list[i]
+                motions[i, 2] = distance
+                motions[i, 4] = turns_list[i]
+            poses[i, 0] = x
+            poses[i, 1] = y
+            poses[i, 2] = theta
+        self.x = x
+        self.y = y
+        self.theta = theta
+        
+        measurement_table = self.measure_block(poses, num_landmarks, measurement_range, measurement_noise)
+        return [poses, motions, measurement_table]
+    
+    def get_landmark_grid(self, num_landmarks, cell_size):
+        """ Returns a LandmarkGrid over the first num_landmarks landmarks, only building a new one when needed """
+        grid = self.landmark_grid
+        if grid is None or len(grid.landmarks) != num_landmarks or grid.requested_cell_size != cell_size:
+            grid = LandmarkGrid(self.landmarks[:num_landmarks], cell_size)
+            self.landmark_grid = grid
+        return grid
+    
+    def in_field_of_view(self, rel_angle):
+        """ Boolean array telling which relative angles are within self.field_of_view """
+        if self.field_of_view is None:
+            return numpy.ones(len(rel_angle), dtype = bool)
+        # normalize to [-pi, pi) first, relative angles of the simulation are not normalized
+        rel_angle = (rel_angle + math.pi) % (2 * math.pi) - math.pi
+        return numpy.abs(rel_angle) <= self.field_of_view / 2
+    
+    def measure_block(self, poses, num_landmarks, measurement_range, measurement_noise):
+        '''
+        Measures the first num_landmarks landmarks from all poses at once, the way run_simulation_dennis does
+        (noisy distance has to be within measurement_range), and also checks field_of_view.
+        Returns measurement_table with rows [i, distance, relative angle, post] for every landmark measured from poses[i].
+        
+        Small worlds just check every landmark from every pose. From GRID_MIN_LANDMARKS landmarks on only the landmarks 
+        close to each pose are looked at, using a LandmarkGrid.
+        '''
+        # Noise changes distance by at most a factor (1 +- measurement_noise), so anything further away than
+        # this can never be measured. Only draw noise for the landmarks which can.
+        if measurement_noise < 1.0:
+            max_distance = measurement_range / (1.0 - measurement_noise)
+        else:
+            max_distance = float('inf')
+        use_grid = num_landmarks >= GRID_MIN_LANDMARKS and max_distance < float('inf') and max_distance > 0
+        landmarks = self.landmarks[:num_landmarks]
+        
+        blocks = []
+        if use_grid:
+            grid = self.get_landmark_grid(num_landmarks, max_distance / 2)
+            # every pose gets about as many candidates as there are landmarks in 16 cells
+            block_steps = max(1, SIMULATION_BLOCK_SIZE * grid.nx * grid.ny // max(1, 16 * num_landmarks))
+        else:
+            block_steps = max(1, SIMULATION_BLOCK_SIZE // max(1, num_landmarks))
+        for start in xrange(0, len(poses), block_steps):
+            block = poses[start:start + block_steps]
+            if use_grid:
+                [steps, indices] = grid.candidates_in_view(block[:, 0], block[:, 1], block[:, 2], max_distance, 
+                                                           self.field_of_view)
+                # grid hands out landmarks per cell, put them in the (step, landmark) order of the other path
+                order = numpy.lexsort((indices, steps))
+                steps = steps[order]
+                indices = indices[order]
+                dx = landmarks[indices, 0] - block[steps, 0]
+                dy = landmarks[indices, 1] - block[steps, 1]
+                close = dx*dx + dy*dy < max_distance*max_distance
+                steps = steps[close]
+                indices = indices[close]
+                dx = dx[close]
+                dy = dy[close]
+            else:
+                dx = landmarks[:, 0] - block[:, 0:1]
+                dy = landmarks[:, 1] - block[:, 1:2]
+                steps, indices = numpy.nonzero(dx*dx + dy*dy < max_distance*max_distance)
+                dx = dx[steps, indices]
+                dy = dy[steps, indices]
+            # The field of view does not depend on the noise, so check it before drawing any. Both paths now have 
+            # the same landmarks in the same order, and the same seed gives the same measurements with or without grid.
+            rel_angle = numpy.arctan2(dy, dx) - block[steps, 2]
+            in_view = self.in_field_of_view(rel_angle)
+            steps = steps[in_view]
+            dist_to_lm = numpy.sqrt(dx[in_view]*dx[in_view] + dy[in_view]*dy[in_view])
+            dist_to_lm *= 1 + (measurement_noise * self.rng.uniform(-1.0, 1.0, len(steps)))
+            observed = dist_to_lm < measurement_range
+            steps = steps[observed]
+            blocks.append(numpy.column_stack((steps + start, dist_to_lm[observed], rel_angle[in_view][observed], numpy.zeros(len(steps)))))
+        
+        if len(blocks) == 0:
+            return numpy.zeros((0, 4))
+        return numpy.concatenate(blocks)
+    
+    def simulate_chunks(self, num_steps, num_landmarks, measurement_range, motion_noise, measurement_noise, distance, 
+                        chunk_size = 1000):
+        '''
+        Generator version of simulate_block. Yields [poses, motions, measurement_table] blocks of chunk_size steps
+        (the last one can be shorter), lazily, so memory use does not depend on num_steps. The first column of 
+        measurement_table is the step counted from the start of the whole run, not from the start of the chunk.
+        
+        num_steps = None keeps going forever.
+        '''
+        first_step = 0
+        while num_steps is None or first_step < num_steps:
+            if num_steps is None:
+                steps = chunk_size
+            else:
+                steps = min(chunk_size, num_steps - first_step)
+            [poses, motions, measurement_table] = self.simulate_block(steps, num_landmarks, measurement_range, 
+                                                                      motion_noise, measurement_noise, distance)
+            measurement_table[:, 0] += first_step
+            yield [poses, motions, measurement_table]
+            first_step += steps
+    
+    def simulate_steps(self, num_steps, num_landmarks, measurement_range, motion_noise, measurement_noise, distance, 
+                       chunk_size = 1000):
+        '''
+        Yields (motion, measurements, true_pose) one step at a time, in the formats of run_simulation_dennis:
+            motion = [time, action, dForwards, dSideways, dtheta, speed], what you give to send_data
+            measurements = list of [distance, relative angle, post], also for send_data
+            true_pose = [x, y, theta] after the step
+        
+        Simulated in chunks of chunk_size steps behind the scenes, so this is as fast as run_simulation_vectorized but 
+        nothing is kept in memory. num_steps = None keeps going forever (for soak tests).
+        '''
+        first_step = 0
+        for [poses, motions, measurement_table] in self.simulate_chunks(num_steps, num_landmarks, measurement_range, 
+                                                                         motion_noise, measurement_noise, distance, chunk_size):
+            steps = len(poses)
+            measurements = measurements_to_lists(measurement_table, steps, first_step)
+            for (motion, measurement, pose) in zip(motions.tolist(), measurements, poses.tolist()):
+                yield (motion, measurement, pose)
+            first_step += steps
+    
+    def run_simulation_vectorized(self, num_steps, num_landmarks, measurement_range, motion_noise, measurement_noise, distance):
+        '''
+        Same as run_simulation_dennis (same output format, so SLAM algorithms run on it unchanged), but computed 
+        by simulate_block. The world size is the one given to the constructor, that is where the landmarks are.
+        
+        Most of the time of a big run goes into turning the arrays of simulate_block into these lists, not into
+        the simulation itself: 100k steps with 1000 landmarks (7 million measurements) take about 5 seconds in
+        simulate_block and about 20 seconds in total here. Use simulate_block or simulate_chunks directly when
+        arrays will do.
+        '''
+        [poses, motions, measurement_table] = self.simulate_block(num_steps, num_landmarks, measurement_range, 
+                                                                  motion_noise, measurement_noise, distance)
+        self.true_robot_positions.extend(poses.tolist())
+        self.observed_motions.extend(motions.tolist())
+        self.observed_measurements.extend(measurements_to_lists(measurement_table, num_steps))
+        
+        return [self.true_robot_positions, self.landmarks, self.observed_motions, self.observed_measurements]
                 
     
     def run_simulation(self, num_steps, num_landmarks, world_size, measurement_range, motion_noise, measurement_noise, distance):
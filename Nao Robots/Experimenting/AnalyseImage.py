@@ -1,4 +1,5 @@
 import Distance as distance
+from LandmarkTracker import LandmarkTracker
 
 
 class AnalyseImage:
@@ -6,12 +7,20 @@ class AnalyseImage:
     #insert angle in degrees
     def __init__(self):
         self.data = []
+        self.tracker = LandmarkTracker()
         #self.angle = a
     
-    def analyse(self, imageName, a, cameraHeight):
-        self.d = distance.Distance(imageName, a, cameraHeight)
+    # image: numpy array of B, G, R bytes (Vision.getFrame()) or the name of an image file
+    # sparse: fast scanline mode instead of processing every pixel, see Distance
+    def analyse(self, image, a, cameraHeight, sparse = False):
+        self.d = distance.Distance(image, a, cameraHeight, sparse)
         return self.d.getData()
 
+    # like analyse, but only searches around the landmarks of the last picture when it can, see LandmarkTracker
+    # motion: the motion data of the robot since the last picture
+    def track(self, image, motion, a, cameraHeight, sparse = False):
+        return self.tracker.analyse(image, motion, a, cameraHeight, sparse)
+
 #an = AnalyseImage()
 ##dat = [(double distance (in meter), double theta (in rad)), boolean goalpost......]
 #dat = an.analyse('analyzeThis.png')
@@ -4,6 +4,8 @@ Created on 27 nov. 2013
 @author: Dennis
 '''
 
+import numpy
+
 def rgb_to_luminance(r, g, b):
     """
     Computes only the luminance from RGB.
@@ -75,4 +77,29 @@ def rgb_to_hue(r, g, b):
         
         h = 4.0+gc-rc
         
-    return (h/6.0) % 1.0
\ No newline at end of file
+    return (h/6.0) % 1.0
+
+def rgb_to_luminance_array(r, g, b):
+    """
+    rgb_to_luminance for whole numpy arrays of r, g and b at once (for example all pixels of an image).
+    Same arithmetic, so the same results as calling rgb_to_luminance on every element.
+    """
+    return (numpy.minimum(numpy.minimum(r, g), b) + numpy.maximum(numpy.maximum(r, g), b)) / 2.0
+
+def rgb_to_hue_array(r, g, b):
+    """
+    rgb_to_hue for whole numpy arrays of r, g and b at once (for example all pixels of an image).
+    Same arithmetic, so the same results as calling rgb_to_hue on every element.
+    """
+    maxc = numpy.maximum(numpy.maximum(r, g), b)
+    minc = numpy.minimum(numpy.minimum(r, g), b)
+    
+    # grey pixels have hue 0.0, divide by 1 there instead of by 0 and fix them at the end
+    grey = (minc == maxc)
+    spread = numpy.where(grey, 1.0, maxc - minc)
+    rc = (maxc - r) / spread
+    gc = (maxc - g) / spread
+    bc = (maxc - b) / spread
+    
+    h = numpy.where(r == maxc, bc - gc, numpy.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    return numpy.where(grey, 0.0, (h / 6.0) % 1.0)
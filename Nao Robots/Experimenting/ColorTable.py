@@ -0,0 +1,246 @@
+'''
+Created on 3 Feb 2014
+
+Lookup tables from a colour to its class (white, yellow, green or black), for segmenting a whole image with one
+numpy indexing operation instead of computing hue and luminance for every pixel.
+
+The class of a pixel in ImageProcessing is its hue class (yellow, green or black, which only depends on its B, G, R
+values and the hue bounds of yellow and green), unless its luminance makes it white. Whether it is white depends on
+Lic, which changes with every picture, so only the hue class is in a table:
+
+    table = get_table((LOWER_BOUND_YELLOW, UPPER_BOUND_YELLOW), (LOWER_BOUND_GREEN, UPPER_BOUND_GREEN))
+    labels = classify(img, table, white_level(threshold, Lic))       # one label per pixel
+    img[:, :] = LABEL_COLORS[labels]                                 # the coloured image ImageProcessing works on
+
+A pixel is white when luminance*255 = (min(R,G,B) + max(R,G,B))/2 is above threshold + (255-threshold)*Lic. min + max
+is an integer, so that is the same as min + max > floor(2*(threshold + (255-threshold)*Lic)), which is white_level.
+classify computes min + max straight from the pixels (like ColorSysCustom.rgb_to_luminance_array), which is as fast
+as looking it up in a table of all colours, so a new Lic costs nothing extra.
+
+Tables are indexed [B, G, R], in the channel order of cv2 images. With bits = 8 every colour has its own entry
+(16.7 million entries, the same result as classifying every pixel). With less bits only the highest bits of every
+channel are used and the entry is for the colour in the middle of its bin: 6 bits gives a table of 256 kB which fits
+in the cache and is much faster to build, but colours close to a hue boundary may get another class. The white test
+is always exact.
+
+Building a table is expensive (a second or so at 8 bits), so they are cached in memory, keyed by their parameters.
+
+Pictures captured in YUV422 (2 bytes per pixel, see Vision) are classified without converting them to RGB. The hue
+only depends on differences between R, G and B, which come straight from the chroma: R-Y = 1.402 V',
+G-Y = -0.344 U' - 0.714 V', B-Y = 1.772 U' (U' = U - 128, V' = V - 128). Adding Y to all three doesn't change the hue,
+so the [U, V] table of get_yuv_table has the hue class of every chroma. The luminance of ImageProcessing,
+(min(R,G,B) + max(R,G,B))/2, is Y plus (min + max)/2 of those differences, which is also a [U, V] table. Y alone is
+not enough: saturated yellow has a much higher Y than luminance and would become white.
+
+The hue class tables are also saved in TABLE_DIRECTORY, as raw files named after a hash of their
+parameters. A new process maps the file into memory (numpy.memmap, read-only) instead of building the table again, so
+starting up is instant and all processes on the machine share the same pages. Files are written to a temporary file
+first and then renamed, so a process never sees half a table. When the directory can't be written the tables just
+stay in memory.
+
+@author: Dennis
+'''
+
+import hashlib
+import math
+import os
+import tempfile
+import numpy
+import ColorSysCustom as csc
+
+# Class labels in the tables
+BLACK = 0
+WHITE = 1
+YELLOW = 2
+GREEN = 3
+
+# Colour of every label in the images of ImageProcessing (B, G, R)
+LABEL_COLORS = numpy.array([(0, 0, 0), (255, 255, 255), (255, 0, 0), (0, 255, 0)], dtype = numpy.uint8)
+
+DEFAULT_BITS = 8
+
+# Where the tables are saved between runs, None to never save them
+TABLE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "nao_color_tables")
+
+# Goes up when the way tables are made changes, so old files are not used anymore
+TABLE_FORMAT_VERSION = 1
+
+# {(bits, yellow bounds, green bounds) : hue class table}
+hue_tables = {}
+
+# {(yellow bounds, green bounds) : [U, V] table of hue classes}, [U, V] table of luminance minus Y (see yuv_luminance)
+yuv_tables = {}
+yuv_offsets = []
+
+def white_level(threshold, Lic):
+    ''' Colours with min(R,G,B) + max(R,G,B) above this integer are white '''
+    return int(math.floor(2 * (threshold + (255 - threshold) * Lic)))
+
+def bin_values(bits):
+    ''' The channel value (0-255) every table index stands for: the middle of its bin, or the value itself at 8 bits '''
+    step = 1 << (8 - bits)
+    return numpy.arange(0, 256, step) + step // 2
+
+def make_hue_table(bits, yellow_bounds, green_bounds):
+    '''
+    Returns the [B, G, R] table of YELLOW, GREEN or BLACK of every colour by hue, the way ImageProcessing.acceptedYellow
+    and acceptedGreen classify it (yellow first). Built one B value at a time to keep the temporary arrays small.
+    '''
+    values = bin_values(bits) / 255.0
+    size = len(values)
+    G = numpy.repeat(values, size).reshape(size, size)
+    R = numpy.tile(values, size).reshape(size, size)
+
+    table = numpy.empty((size, size, size), dtype = numpy.uint8)
+    for b in xrange(size):
+        B = numpy.empty_like(G)
+        B.fill(values[b])
+        H = csc.rgb_to_hue_array(R, G, B)
+        yellow = (H >= yellow_bounds[0]) & (H <= yellow_bounds[1])
+        green = ~yellow & (H >= green_bounds[0]) & (H <= green_bounds[1])
+        table[b] = numpy.where(yellow, YELLOW, numpy.where(green, GREEN, BLACK))
+    return table
+
+def get_table(yellow_bounds, green_bounds, bits = DEFAULT_BITS):
+    '''
+    Returns the hue class table (read-only, [B, G, R]) for these hue bounds, from the cache if it was made before.
+    yellow_bounds and green_bounds are (lower, upper) hue bounds as in ImageProcessing.
+    '''
+    key = (bits, tuple(yellow_bounds), tuple(green_bounds))
+    if key not in hue_tables:
+        hue_tables[key] = load_or_make("hue", key, numpy.uint8, bits, lambda: make_hue_table(bits, yellow_bounds, green_bounds))
+    return hue_tables[key]
+
+def table_path(name, parameters):
+    ''' File of the table called name with these parameters (a tuple of numbers), in TABLE_DIRECTORY '''
+    key = repr((TABLE_FORMAT_VERSION, name, parameters))
+    return os.path.join(TABLE_DIRECTORY, name + "_" + hashlib.sha1(key).hexdigest()[:16] + ".bin")
+
+def load_or_make(name, parameters, dtype, bits, make):
+    '''
+    Returns the table with this name and parameters, memory mapped from its file in TABLE_DIRECTORY if there is one.
+    Otherwise the table is made with make() and saved, for the next process.
+    '''
+    size = 1 << bits
+    shape = (size, size, size)
+    if TABLE_DIRECTORY is None:
+        table = make()
+        table.flags.writeable = False
+        return table
+
+    path = table_path(name, parameters)
+    if os.path.exists(path) and os.path.getsize(path) == numpy.dtype(dtype).itemsize * size**3:
+        return numpy.memmap(path, dtype = dtype, mode = "r", shape = shape)
+
+    table = make()
+    table.flags.writeable = False
+    save_table(table, path)
+    return table
+
+def save_table(table, path):
+    ''' Writes table to path atomically: to a temporary file in the same directory, then renamed '''
+    try:
+        if not os.path.isdir(TABLE_DIRECTORY):
+            os.makedirs(TABLE_DIRECTORY)
+        (handle, temporary) = tempfile.mkstemp(dir = TABLE_DIRECTORY, suffix = ".tmp")
+    except OSError as e:
+        print "Could not save color table in " + TABLE_DIRECTORY + ": " + str(e)
+        return
+
+    try:
+        with os.fdopen(handle, "wb") as output:
+            table.tofile(output)
+        # mkstemp makes the file private, other users should be able to share it too
+        os.chmod(temporary, 0644)
+        os.rename(temporary, path)
+    except (IOError, OSError) as e:
+        # on windows rename fails when another process saved the same table first, which is fine
+        if not os.path.exists(path):
+            print "Could not save color table " + path + ": " + str(e)
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+def color_indices(img, bits):
+    ''' Index of every pixel of the BGR image img (uint8, rows x cols x 3) in the flattened table of get_table '''
+    shift = 8 - bits
+    index = (img[:, :, 0] >> shift).astype(numpy.intp) << (2 * bits)
+    index |= (img[:, :, 1] >> shift).astype(numpy.intp) << bits
+    index |= img[:, :, 2] >> shift
+    return index
+
+def classify(img, table, white):
+    '''
+    Returns the label of every pixel of the BGR image img (uint8, rows x cols x 3): WHITE when min(R,G,B) + max(R,G,B)
+    is above white (see white_level), otherwise the hue class from table (see get_table).
+    '''
+    bits = int(round(math.log(table.shape[0], 2)))
+    labels = table.reshape(-1).take(color_indices(img, bits))
+    #channel by channel, numpy is slow at min and max over an axis of 3. min + max is at most 510, so it fits in 16 bits
+    [B, G, R] = [img[:, :, 0], img[:, :, 1], img[:, :, 2]]
+    level = numpy.minimum(numpy.minimum(B, G), R).astype(numpy.uint16) + numpy.maximum(numpy.maximum(B, G), R)
+    labels[level > white] = WHITE
+    return labels
+
+def get_yuv_table(yellow_bounds, green_bounds):
+    '''
+    Returns the (read-only) [U, V] table of YELLOW, GREEN or BLACK of every chroma by hue, classified like
+    make_hue_table does for RGB. Only 64 kB, so it is made in memory.
+    '''
+    key = (tuple(yellow_bounds), tuple(green_bounds))
+    if key in yuv_tables:
+        return yuv_tables[key]
+
+    [R, G, B] = chroma_differences()
+    H = csc.rgb_to_hue_array(R, G, B)
+    yellow = (H >= yellow_bounds[0]) & (H <= yellow_bounds[1])
+    green = ~yellow & (H >= green_bounds[0]) & (H <= green_bounds[1])
+    table = numpy.where(yellow, YELLOW, numpy.where(green, GREEN, BLACK)).astype(numpy.uint8)
+    table.flags.writeable = False
+
+    yuv_tables[key] = table
+    return table
+
+def chroma_differences():
+    ''' [R-Y, G-Y, B-Y] for every [U, V] '''
+    U = numpy.arange(256)[:, numpy.newaxis] - 128.0
+    V = numpy.arange(256)[numpy.newaxis, :] - 128.0
+    return numpy.broadcast_arrays(1.402*V, -0.344*U - 0.714*V, 1.772*U)
+
+def yuv_luminance(img):
+    '''
+    Luminance (min(R,G,B) + max(R,G,B))/2 in 0-255 of every pixel of img (rows x cols x 3 with Y, U, V of every pixel).
+    Not every Y, U, V is a colour, the R, G, B of some of them are outside 0-255. Their luminance is clipped to 0-255,
+    like the camera clips R, G and B.
+    '''
+    if len(yuv_offsets) == 0:
+        [R, G, B] = chroma_differences()
+        offset = ((numpy.minimum(numpy.minimum(R, G), B) + numpy.maximum(numpy.maximum(R, G), B)) / 2.0).astype(numpy.float32)
+        offset.flags.writeable = False
+        yuv_offsets.append(offset)
+    return numpy.clip(img[:, :, 0] + yuv_offsets[0][img[:, :, 1], img[:, :, 2]], 0, 255)
+
+def classify_yuv(img, table, cut):
+    '''
+    Returns the label of every pixel of img (uint8, rows x cols x 3 with Y, U, V of every pixel, see yuv422_to_yuv):
+    WHITE when its luminance is above cut, otherwise the hue class of table from get_yuv_table
+    '''
+    return numpy.where(yuv_luminance(img) > cut, numpy.uint8(WHITE), table[img[:, :, 1], img[:, :, 2]])
+
+def yuv422_to_yuv(frame):
+    '''
+    Spreads a YUV422 picture (uint8, rows x cols x 2: Y of every pixel, then U for even and V for odd columns, as the
+    camera sends it) to rows x cols x 3 with Y, U, V for every pixel. Two neighbouring pixels share U and V.
+    '''
+    yuv = numpy.empty(frame.shape[0:2] + (3,), dtype = numpy.uint8)
+    yuv[:, :, 0] = frame[:, :, 0]
+    yuv[:, 0::2, 1] = frame[:, 0::2, 1]
+    yuv[:, 1::2, 1] = frame[:, 0::2, 1]
+    yuv[:, 0::2, 2] = frame[:, 1::2, 1]
+    yuv[:, 1::2, 2] = frame[:, 1::2, 1]
+    return yuv
+
+def clear_cache():
+    ''' Forgets all tables in memory, for example to free it. Saved tables stay in TABLE_DIRECTORY. '''
+    hue_tables.clear()
+    yuv_tables.clear()
+    del yuv_offsets[:]
@@ -5,12 +5,133 @@ Created on 2 Dec 2013
 '''
 
 import math
+import numpy
+
+def flatten_measurements(roel_array):
+    '''
+    Flattens measurements as they are send to us (roel_array[t] = list of [d(r,l),relAngle,post])
+    into one table with a row [t,d(r,l),relAngle,post] per measurement. Post is stored as 1.0 or 0.0.
+    Empty measurements are skipped.
+    '''
+    rows = []
+    for t in xrange(len(roel_array)):
+        for one_sense in roel_array[t]:
+            if (len(one_sense) != 0):
+                rows.append([t,one_sense[0],one_sense[1],1.0 if one_sense[2] else 0.0])
+    if (len(rows) == 0):
+        return numpy.zeros((0,4))
+    return numpy.array(rows,dtype = float)
+
+def motion_columns(gabi_array):
+    '''
+    Returns [dForwards,dSideways,dtheta] columns of motion data as a numpy array. Works both on
+    a list of [time,action,dx,dy,dtheta,speed] (time is a string there) and on a numpy array of them.
+    '''
+    if isinstance(gabi_array,numpy.ndarray):
+        return numpy.asarray(gabi_array[:,2:5],dtype = float).reshape(-1,3)
+    return numpy.array([motion_info[2:5] for motion_info in gabi_array],dtype = float).reshape(-1,3)
+
+def normalize_angles(angles):
+    """ Maps (arrays of) angles to [-pi, pi) """
+    return (numpy.asarray(angles, dtype = float) + math.pi) % (2 * math.pi) - math.pi
+
+def low_variance_resample(weights, rng):
+    '''
+    Low variance resampling for the particle filters: one random number from rng, then as many evenly spaced picks
+    as there are particles. weights must sum to 1. Returns the indices of the chosen particles.
+    '''
+    num_particles = len(weights)
+    positions = (rng.uniform(0.0, 1.0) + numpy.arange(num_particles)) / num_particles
+    cumulative = numpy.cumsum(weights)
+    cumulative[-1] = 1.0
+    return numpy.searchsorted(cumulative, positions)
+
+def step_key(gabi_array,roel_array,t):
+    '''
+    Cheap fingerprint of step t of a history: the text of its motion and measurements. Works for lists and numpy
+    arrays of motions alike.
+    '''
+    motion = gabi_array[t]
+    if isinstance(motion,numpy.ndarray):
+        motion = motion.tolist()
+    return repr((list(motion),roel_array[t]))
+
+class LandmarkIndex:
+    '''
+    Spatial index over rough landmark positions, used for data association.
+    
+    Landmarks are hashed into a uniform grid whose cells are as wide as the association radius
+    (square root of threshold, since threshold is a squared distance like everywhere else in here).
+    Posts and corners are kept in separate grids, because we never associate one with the other.
+    Because of the cell size, a nearest query within the threshold only has to look at the 3x3 block
+    of cells around the query point, no matter how many landmarks we have seen so far.
+    '''
+    
+    def __init__(self,threshold):
+        self.threshold = threshold
+        if (threshold > 0):
+            self.cell_size = math.sqrt(threshold)
+        else:
+            # Threshold of zero only matches exact duplicates, they always end up in the same cell
+            self.cell_size = 1.0
+        self.cells = {}
+        
+    def cell_of(self,x,y):
+        return (int(math.floor(x / self.cell_size)),int(math.floor(y / self.cell_size)))
+    
+    def insert(self,x,y,post,index):
+        (cx,cy) = self.cell_of(x,y)
+        key = (bool(post),cx,cy)
+        if key not in self.cells:
+            self.cells[key] = []
+        self.cells[key].append((x,y,index))
+        
+    def nearest(self,x,y,post):
+        '''
+        Returns index of the nearest landmark with the same post flag which is within threshold
+        (squared distance) of (x,y), or -1 if there is no such landmark. On equal distance the
+        landmark inserted first wins.
+        '''
+        (cx,cy) = self.cell_of(x,y)
+        post = bool(post)
+        bestIndex = -1
+        bestDistance = 0.0
+        for i in (cx - 1,cx,cx + 1):
+            for j in (cy - 1,cy,cy + 1):
+                cell = self.cells.get((post,i,j))
+                if cell is None:
+                    continue
+                for (lx,ly,index) in cell:
+                    distance = (x - lx) * (x - lx) + (y - ly) * (y - ly)
+                    if (distance > self.threshold):
+                        continue
+                    if (bestIndex == -1 or distance < bestDistance or (distance == bestDistance and index < bestIndex)):
+                        bestDistance = distance
+                        bestIndex = index
+        return bestIndex
+    
+    def __len__(self):
+        return sum(len(cell) for cell in self.cells.itervalues())
 
 class CommonFunctionality:
     
     def __init__(self,error = 400):
-        self.landmarks = []
         self.threshold_landmark_error = error
+        self.reset()
+        
+    def reset(self):
+        '''
+        Forgets everything processed so far (landmarks, data and running estimates).
+        '''
+        self.landmarks = []
+        self.landmark_index = LandmarkIndex(self.threshold_landmark_error)
+        # Processed prefix of the history, and where dead reckoning got us at the end of it
+        self.data = []
+        # step_key of the first and the last processed step, to check a new history continues the processed one
+        self.processed_keys = None
+        self.orientation = 0.0
+        self.robotX = 0.0
+        self.robotY = 0.0
     
     def make_data(self,motion_array,measurement_array,initialX = 0,initialY = 0):
         '''
@@ -20,105 +141,120 @@ class CommonFunctionality:
         landmarks to it. So, if we haven`t seen anything at that moment, we won`t update our matrix with any data about landmarks
         but motion will still be updated. So, to summarize, every element of data is one whole step of motion and measurements.
         As already mentioned at time step t, motion at t is data[t][1] and measurements of time step t is data[t][0]
+        
+        Engine remembers what it processed before. If motion_array and measurement_array are the same history as in
+        the previous call with some steps appended (that is what online graph slam does), only the new steps are processed
+        and the returned array is the old one with new steps appended. If history got shorter, or
+        its first or last processed step is not what we processed before (another history), we start over.
+        initialX and initialY only matter when nothing has been processed yet.
+        
+        The returned array is the one the engine keeps, so it must not be changed. Copy it first if you need to.
         '''
-        data = []
-        
-        # Changed method so that it returns whole data array for once(without separations, it just puts all together)
-        data = self.pre_process_data(motion_array,measurement_array,initialX,initialY)
-        
-            
-        # We do not need any randomness, so we will just go through arrays and add data
-          
-        # This part should be clarified, because I am not sure how data is going to be send around
-        # My assumption : measurement_array has measurement send from Roel but we update that array with newer one before sending it here where indices are specified as well
-        # For motion I assume it is an array that has dx and dy in it. Some preprocessing might be needed
-        # Preprocessing needed might be about addind data send by Gabi to history of motions in case Gabi sends only last motion.
-  
+        processed = len(self.data)
+        if (len(motion_array) < processed):
+            self.reset()
+        elif (processed > 0 and self.processed_keys != (step_key(motion_array,measurement_array,0),
+                                                        step_key(motion_array,measurement_array,processed - 1))):
+            self.reset()
+        
+        if (len(self.data) == 0):
+            self.robotX = initialX
+            self.robotY = initialY
+            self.orientation = 0.0
+        
+        first_new = len(self.data)
+        if (first_new < len(motion_array)):
+            new_data = self.pre_process_data(motion_array[first_new:],measurement_array[first_new:],self.robotX,self.robotY,self.orientation)
+            self.data.extend(new_data)
+            self.processed_keys = (step_key(motion_array,measurement_array,0),
+                                   step_key(motion_array,measurement_array,len(motion_array) - 1))
                 
-        return data
+        return self.data
     
     
-    def pre_process_data(self,gabi_array,roel_array,initialX,initialY):
+    def pre_process_data(self,gabi_array,roel_array,initialX,initialY,initialOrientation = 0.0):
         
         '''
         Method that pre processes data to make it usable for make_data method.
         Information we get from gabi : [time,action,dx,dy,dtheta,speed]
-        Information we get from roel : [d(r,l),relativeAngle]
+        Information we get from roel : [d(r,l),relAngle]
+        
+        Just brings the data in array form and hands it to pre_process_arrays.
         '''
-        result = []
-        orientation = 0;
+        return self.pre_process_arrays(motion_columns(gabi_array),flatten_measurements(roel_array),initialX,initialY,initialOrientation)
+    
+    def pre_process_arrays(self,motions,measurement_table,initialX,initialY,initialOrientation = 0.0):
+        
         '''
-        Processing of gabi`s informations.
-        I read actions,dx,dy and dtheta at each step. I update orientation of robot
-        and then I add new data to gabi_data array, adding last movement and I guess size of Gabi and Roel`s arrays are same
+        Same as pre_process_data, but works on numpy arrays and does all the geometry for all steps at once.
+        motions[t] = [dForwards,dSideways,dtheta] (see motion_columns)
+        measurement_table[k] = [t,d(r,l),relAngle,post] (see flatten_measurements)
+        
+        Returns the same data array graphSlam consumes: result[t] = [roel_data,gabi_data] with
+        gabi_data = [[dx,dy,orientation]] and roel_data = list of [landmarkIndex,xDistance,yDistance,post].
+        
+        Orientation and position start from the given initial values, and where we end up is kept in
+        self.orientation, self.robotX and self.robotY so that the next steps can continue from there.
         '''
-        for i in range(len(gabi_array)):
-            gabi_data = []
-            roel_data = []
-            motion_info = gabi_array[i]
-            #Only adding data from gabi if it is of type 3(move/rotate)
-            forwardMove = motion_info[2]
-            sideMove = motion_info[3]
-            dtheta = motion_info[4]
-            # These are radians. And I am not taking modulo or anything.
-            orientation += dtheta
-            #orientation = self.normalize_angle(orientation)
-
-            dx = forwardMove * math.cos(orientation) + sideMove * math.sin(orientation)
-            dy = forwardMove * math.sin(orientation) + sideMove * math.cos(orientation)
-            # If orientation is zero, then y might not change.
-            # This part is interesting. It basically says that, if there is no orientation, then y can not change?
-            # That just sounds silly to me. I guess it moves sideways, soo this code WILL/SHOULD CHANGE!!!
-            # Ok, changed it. Also, I think we should keep them as being dx and dy as cos and sin are already taken
-            # into account.
-            gabi_data.append([dx ,dy,orientation])
-            #Keeping rough estimate of where we are for each step
-            
-            initialX += dx
-            initialY += dy
-            
-            #Processing Roel`s data which is of format [d(r,l),relAngle]
-            
-            # Accessing data from time step i.
-            # It might have more than one sensed landmark, so we will loop through for each of them
-            
-            sense_data = roel_array[i]
-            for k in range(len(sense_data)):
-                one_sense = sense_data[k]
-                if (len(one_sense) != 0):
-                    distanceToLand = sense_data[k][0]
-                    relativeAngle = sense_data[k][1]
-                    post = sense_data[k][2]
-                    # Added orientation to relative angle as I think it should be like this
-                    # (As discussed with Dennis)
-                    xDistance = distanceToLand * math.cos(relativeAngle + orientation)
-                    yDistance = distanceToLand * math.sin(relativeAngle + orientation)
-                    # Rough estimates of where landmark is (very rough)
-                    roughXlandmark = initialX + xDistance
-                    roughYlandmark = initialY + yDistance
-                    index = self.landmark_check(roughXlandmark,roughYlandmark,post)
-                    roel_data.append([index,xDistance,yDistance,post])
-            result.append([roel_data,gabi_data])
+        num_steps = len(motions)
+        if (num_steps == 0):
+            return []
+        forwardMove = motions[:,0]
+        sideMove = motions[:,1]
+        # These are radians. And I am not taking modulo or anything.
+        # Initial values go in front of the sums, so we add up in exactly the same order as one long history would.
+        orientation = numpy.cumsum(numpy.append(initialOrientation,motions[:,2]))[1:]
+        cos_orientation = numpy.cos(orientation)
+        sin_orientation = numpy.sin(orientation)
+        # Keeping them as dx and dy, cos and sin are already taken into account here.
+        dx = forwardMove * cos_orientation + sideMove * sin_orientation
+        dy = forwardMove * sin_orientation + sideMove * cos_orientation
+        #Keeping rough estimate of where we are for each step
+        robotX = numpy.cumsum(numpy.append(initialX,dx))[1:]
+        robotY = numpy.cumsum(numpy.append(initialY,dy))[1:]
+        self.orientation = float(orientation[-1])
+        self.robotX = float(robotX[-1])
+        self.robotY = float(robotY[-1])
+        
+        # Measurements of step t are taken after motion of step t
+        steps = measurement_table[:,0].astype(int)
+        angle = measurement_table[:,2] + orientation[steps]
+        xDistance = measurement_table[:,1] * numpy.cos(angle)
+        yDistance = measurement_table[:,1] * numpy.sin(angle)
+        # Rough estimates of where landmark is (very rough)
+        roughXlandmark = robotX[steps] + xDistance
+        roughYlandmark = robotY[steps] + yDistance
+        posts = measurement_table[:,3] != 0.0
+        
+        result = [[[],[gabi]] for gabi in numpy.column_stack((dx,dy,orientation)).tolist()]
+        
+        # Association has to go in order, since every new landmark changes the answer for later ones.
+        # With landmark_index that is constant time per measurement though.
+        stepList = steps.tolist()
+        xList = xDistance.tolist()
+        yList = yDistance.tolist()
+        roughXList = roughXlandmark.tolist()
+        roughYList = roughYlandmark.tolist()
+        postList = posts.tolist()
+        for k in xrange(len(stepList)):
+            index = self.landmark_check(roughXList[k],roughYList[k],postList[k])
+            result[stepList[k]][0].append([index,xList[k],yList[k],postList[k]])
 
         return result
     
     def landmark_check(self,roughNewLandmarkX,roughNewLandmarkY,post):
-        
-        indexFound = -1
-        
-        for k in range(len(self.landmarks)):
-            landmark = self.landmarks[k]
-            if (landmark[2] == post):
-                xDistance = math.pow(roughNewLandmarkX - landmark[0], 2)
-                yDistance = math.pow(roughNewLandmarkY - landmark[1], 2)
-                if ((xDistance + yDistance) <= self.threshold_landmark_error):
-                    # This means landmark is way too similar, so should just give it an existing index.
-                    indexFound = k
+        '''
+        Returns index of the nearest known landmark of the same kind (post or not) within
+        threshold_landmark_error. If there is none, the landmark is added as a new one.
+        Goes through landmark_index instead of all landmarks, so this is constant time per measurement.
+        '''
+        indexFound = self.landmark_index.nearest(roughNewLandmarkX,roughNewLandmarkY,post)
         
         if (indexFound == -1):
             # Means we  did not find this landmark
             self.landmarks.append([roughNewLandmarkX,roughNewLandmarkY,post])
             indexFound = len(self.landmarks) - 1
+            self.landmark_index.insert(roughNewLandmarkX,roughNewLandmarkY,post,indexFound)
                 
         return indexFound    
      
@@ -9,9 +9,12 @@ from GraphSLAMInherited import GraphSLAMInherited
 #from MapViewer import MapViewer
 from AnalyseImage import AnalyseImage
 
+# Capture YUV422 pictures instead of RGB, see Vision
+CAPTURE_YUV422 = False
+
 analyzeObj = AnalyseImage()
 motionObj = Motion()
-visionObj = Vision()
+visionObj = Vision(yuv422 = CAPTURE_YUV422)
 ekfSlamObj = EkfSLAM()
 graphSlamObj = GraphSLAMInherited()
 #imageProcObj = ImageProcessing()
@@ -59,7 +62,7 @@ class ControlFlow:
                 # turn 90 deg clockwise
                 motion_data = self.part_1(0, 0, 90)
             #2. DO image processing
-            measurement_data = self.part_2()
+            measurement_data = self.part_2(motion_data)
             #3. SEND data for slam, Ekf
             self.part_3(measurement_data, motion_data, kind)
             #4. RUN slam
@@ -84,7 +87,7 @@ class ControlFlow:
                 # turn 90 deg clockwise
                 motion_data = self.part_1(0, 0, 90)
             #2. DO image processing
-            measurement_data = self.part_2()
+            measurement_data = self.part_2(motion_data)
             #3. SEND data for slam, Graph
             self.part_3(measurement_data, motion_data, kind)
             #4. RUN slam
@@ -117,9 +120,10 @@ class ControlFlow:
         return motion_data
 
     # 2. DO image processing
-    def part_2(self):
+    # motion_data: motion since the last picture, the landmarks of that picture are then followed (faster)
+    def part_2(self, motion_data = None):
         print "part 2 initializing - process the image"
-        measurement_data = analyzeObj.analyse("analyzeThis.png", self.angle, self.cameraHeight)
+        measurement_data = analyzeObj.track(visionObj.getFrame(), motion_data, self.angle, self.cameraHeight)
         print "part 2 COMPLETE"
 
         return measurement_data
@@ -20,20 +20,58 @@ import math
 #CAMERA_V_FOV=34.8*DEG2RAD # Vertical field of view
 #CAMERA_FOV_BEND_COEFFICIENT=pow(math.sin(CAMERA_H_FOV/2.0), 2) # X-Coefficient for circle segments within FOV
 
+# Rows above the horizon (plus this margin) are not searched for field lines, see horizonRow
+HORIZON_MARGIN = 20
+
+# Camera model of calculateStuff and horizonRow. LandmarkTracker projects landmarks back into the picture with the
+# same values, so they are only defined here. The resolution is not part of it, it is taken from the image.
+DEG2RAD = np.pi/180.0 # Convert Deg to Rad
+FOVHOR = 46.40 * DEG2RAD #"horizontal" field of view
+FOVVER = 34.80 * DEG2RAD #"vertical" field of view
+
+# Height of a goalpost in meters, like cameraHeight. Only tells how far above the horizon a goalpost can be found
+GOALPOST_HEIGHT = 0.8
+
+def goalpostMargin(minYellow, cameraHeight):
+    '''
+    Rows above the horizon which have to be classified to find every goalpost that ImageProcessing can find (more than
+    minYellow rows of yellow standing on the field). A goalpost at distance d goes from cameraHeight/d below the
+    horizon to (GOALPOST_HEIGHT - cameraHeight)/d above it (radians, about linear in rows). The ones just long enough
+    to be found are the furthest ones, and their top minYellow rows start minYellow*(1 - cameraHeight/GOALPOST_HEIGHT)
+    rows above the horizon. Closer goalposts are longer but stand lower, so for them these rows are enough too.
+    '''
+    return max(0, int(np.ceil(minYellow * (1 - cameraHeight / GOALPOST_HEIGHT))) + 1)
+
 class Distance():
 
 
-    def __init__(self, imgString, a, cameraHeight):
+    # image: numpy array of B, G, R bytes or the name of an image file, see ImageProcessing
+    # sparse: only look at scanlines (ImageProcessing.startScanlines) instead of every pixel, much faster
+    # windows: only look in these [top, bottom, left, right] parts of the image, see LandmarkTracker
+    def __init__(self, image, a, cameraHeight, sparse = False, windows = None):
 
         self.min_slope = 0.3
         self.scalar = 0.001
         self.ang = a
         self.cameraHeight = cameraHeight
-
-        self.IP = ip.ImageProcessing(imgString)
+        #windows are small, inside them every pixel is looked at
+        self.sparse = sparse and windows is None
+
+        self.IP = ip.ImageProcessing(image)
+        self.fieldTop = 0
+        if self.ang is not None:
+            self.fieldTop = int(np.clip(np.floor(self.horizonRow()) - HORIZON_MARGIN, 0, self.IP.getWidthImage()))
+            # field lines start HORIZON_MARGIN under the horizon, goalposts can reach above it
+            margin = goalpostMargin(self.IP.minYellow, cameraHeight) - HORIZON_MARGIN
+            self.IP.setFieldTop(self.fieldTop, max(0, margin))
+        self.IP.setWindows(windows)
         self.IP.setThreshold(120)
-        self.IP.getAverageLightIntensity(self.IP.getWidthImage(), self.IP.getHeightImage(), self.IP.getImage(), 0.4)
-        self.IP.startLumi()
+        if self.sparse:
+            self.IP.getAverageLightIntensity(self.IP.getWidthImage(), self.IP.getHeightImage(), self.IP.getImage(), 0.05)
+            self.IP.startScanlines()
+        else:
+            self.IP.getAverageLightIntensity(self.IP.getWidthImage(), self.IP.getHeightImage(), self.IP.getImage(), 0.4)
+            self.IP.startLumi()
         avgSizeImage = ((self.getIP().getHeightImage() + self.getIP().getWidthImage())/2)
         self.minDistanceSquared = avgSizeImage*avgSizeImage*self.scalar
         self.minDistanceSquared2 = self.minDistanceSquared*5
@@ -43,8 +81,11 @@ class Distance():
 
     def findLandmarks(self):
 
-        gray = cv2.cvtColor(self.getIP().getImage(), cv2.COLOR_BGR2GRAY)
-        self.edges = cv2.Canny(gray, 0, 100,  apertureSize=5)
+        self.edges = np.zeros(self.getIP().getImage().shape[0:2], dtype = np.uint8)
+        if not self.sparse:
+            #only below the horizon, rows above it stay without edges
+            gray = cv2.cvtColor(self.getIP().getImage()[self.fieldTop:], cv2.COLOR_BGR2GRAY)
+            self.edges[self.fieldTop:] = cv2.Canny(gray, 0, 100,  apertureSize=5)
         #self.edges = cv.Canny()
         #gray = cv2.cvtColor(self.getIP().getNewImage(),cv2.COLOR_BGR2GRAY)
         #gray = np.float32(gray)
@@ -60,7 +101,15 @@ class Distance():
 
         #self.edges = cv2.cvtColor(self.getIP().getImage(),cv2.COLOR_BGR2GRAY)
         lines = []
-        lines = cv2.HoughLinesP(self.edges,1,np.pi/360, 10, minLineLength = 40, maxLineGap = 5)
+        if self.sparse:
+            #line segments of the scanlines, same format as HoughLinesP
+            lines = [self.getIP().getSegments()]
+        else:
+            lines = cv2.HoughLinesP(self.edges[self.fieldTop:],1,np.pi/360, 10, minLineLength = 40, maxLineGap = 5)
+            if lines is not None:
+                #back to rows of the whole image
+                lines[0][:, 1] += self.fieldTop
+                lines[0][:, 3] += self.fieldTop
         if lines is not None:
             for i in xrange(0, len(lines[0])):
                 xA1,yA1,xA2,yA2 = lines[0][i]
@@ -124,20 +173,30 @@ class Distance():
         return self.IP
 
 
+    def horizonRow(self):
+        '''
+        Row of the image where the horizon is, from the head angle and the camera model of calculateStuff: a row looks
+        at the ground under the angle yAngle, which reaches 90 degrees at the horizon. Nothing above it can be a
+        field line or the bottom of a goalpost. Negative when the horizon is above the image. The number of rows
+        is taken from the image, so it also works for other capture resolutions.
+        '''
+        rows = float(self.IP.getWidthImage())
+
+        B = self.ang * DEG2RAD - 0.5 * FOVVER # angle between ground to bottom of image
+        return rows - ((np.pi/2 - B) / FOVVER) * rows
+
+
     def calculateStuff(self, x, y, post):
 
         x2 = x
         y2 = y
-        DEG2RAD = np.pi/180.0 # Convert Deg to Rad
         RAD2DEG = 180.0/np.pi # Convert Rad to Deg
-        RESW = 320.0 #320.0 #Capture width
-        RESH = 240.0 #240.0 #Capture height
-        FOVHOR = 46.40 * DEG2RAD #"horizontal" field of view
-        FOVVER = 34.80 * DEG2RAD #"vertical" field of view
 
         angle = self.ang * DEG2RAD
         B = angle - 0.5 * FOVVER # angle between ground to bottom of image
         HB = self.cameraHeight #height bot
+        RESW = float(self.IP.getHeightImage()) # columns of the image
+        RESH = float(self.IP.getWidthImage()) # rows of the image
         x = RESW - x # rotation counter clockwise
         x = x - RESW/2 # relative to center of image
         xAngle = (x/(RESW/2)) * (FOVHOR/2)  # in degrees
@@ -1,9 +1,20 @@
 '''
 Created on 4 jan. 2014
 
+The MATLAB EKF-SLAM example below, and a python port of the world it simulates (generate_scenario), which we use
+as a long horizon stress benchmark for our SLAM backends.
+
 @author: Dennis
 '''
 
+import math
+import os
+import sys
+import time
+import numpy
+
+from AbstractSLAMProblem import make_random_generator
+
 # EXAMPLE MATLAB CODE
 
 '''
@@ -262,4 +273,177 @@ if(~any(diag(P)==0))
     el = [el el(:,1)]+repmat(x,1,size(el,2)+1);
     eH = line(el(1,:),el(2,:) );
 end;
-'''
\ No newline at end of file
+'''
+# PYTHON PORT OF THE SIMULATED WORLD ABOVE
+
+'''
+Expected run times (python 2.7, numpy 1.16, one core, seed 1, backends run offline on the first num_steps steps):
+
+    generate_scenario, all 8000 steps           0.06 s
+
+    num_steps     EkfSLAM         GraphSLAMInherited
+    250           0.07 s          0.09 s
+    500           0.5 s           0.5 s
+    1000          5.4 s           2.9 s
+    2000          147 s           26 s
+
+Both backends grow much faster than linear here: sensor noise at 100 units range is big compared to the association
+thresholds, so the backends keep adding landmarks (EKF ends up with ~700 at 2000 steps instead of 40). The full
+8000 steps don't finish in reasonable time for either of them yet, which is what makes this a useful stress test.
+'''
+
+# Settings of the MATLAB example
+NUM_STEPS = 8000
+NUM_FEATURES = 40
+MAP_SIZE = 200.0
+FIELD_OF_VIEW = 45 * math.pi / 180          # the example accepts bearings up to this far from straight ahead
+SENSOR_RANGE = 100.0
+ROBOT_CONTROL = [0.0, 0.15, 0.2 * math.pi / 180]                    # [sideways, forwards, turn] every step
+ODOMETRY_NOISE = [0.01, 0.01, 1.5 * math.pi / 180]                  # standard deviations (sqrt(UTrue))
+MEASUREMENT_NOISE = [1.1, 5 * math.pi / 180]                        # standard deviations (sqrt(RTrue))
+START_POSE = [0.0, 0.0, -math.pi / 2]
+
+def angle_wrap(angle):
+    """ AngleWrap of the MATLAB code: maps (arrays of) angles to [-pi, pi) """
+    return (angle + math.pi) % (2 * math.pi) - math.pi
+
+def tcomp(a, b):
+    """
+    Composition of transformations [x, y, theta]: b expressed in the frame of a. Works on single transformations
+    and on arrays with one transformation per row (then a and b are broadcast against each other).
+    """
+    a = numpy.asarray(a, dtype = float)
+    b = numpy.asarray(b, dtype = float)
+    cos_a = numpy.cos(a[..., 2])
+    sin_a = numpy.sin(a[..., 2])
+    return numpy.stack([a[..., 0] + b[..., 0] * cos_a - b[..., 1] * sin_a,
+                        a[..., 1] + b[..., 0] * sin_a + b[..., 1] * cos_a,
+                        angle_wrap(a[..., 2] + b[..., 2])], -1)
+
+def tinv(a):
+    """ Inverse of transformation(s) a, so that tcomp(a, tinv(a)) is [0, 0, 0] """
+    a = numpy.asarray(a, dtype = float)
+    cos_a = numpy.cos(a[..., 2])
+    sin_a = numpy.sin(a[..., 2])
+    return numpy.stack([-a[..., 0] * cos_a - a[..., 1] * sin_a,
+                        a[..., 0] * sin_a - a[..., 1] * cos_a,
+                        -a[..., 2]], -1)
+
+def standard_normal(rng, size):
+    """ Normal distributed numbers, from a numpy Generator or RandomState """
+    return rng.normal(0.0, 1.0, size)
+
+def random_integers(rng, high, size):
+    """ Random integers in [0, high), from a numpy Generator (integers) or RandomState (randint) """
+    if hasattr(rng, 'integers'):
+        return rng.integers(0, high, size)
+    return rng.randint(0, high, size)
+
+def generate_scenario(num_steps = NUM_STEPS, num_features = NUM_FEATURES, map_size = MAP_SIZE, field_of_view = FIELD_OF_VIEW,
+                      sensor_range = SENSOR_RANGE, seed = None):
+    """
+    Simulates the world of the MATLAB example without any loops over steps, and returns it the way
+    AbstractSLAMProblem.run_simulation_dennis does:
+        [true_positions, landmarks, motions, measurements]
+    true_positions[i] = [x, y, theta] after step i, landmarks is a (num_features, 2) numpy array,
+    motions[i] = [time, action, dForwards, dSideways, dtheta, speed] and measurements[i] = list of
+    [distance, relative angle, post], ready for send_data.
+    
+    Like in the MATLAB code
+        - the true robot drives a circle with a fixed control, only its odometry is noisy. The control the SLAM gets is
+          tcomp(tinv(odometry before), odometry after), which is the true control composed with that step's noise.
+        - every step the robot tries up to half the number of features (rounded up, minus one) random features, and
+          measures the first one which is within range and field of view. So there is at most one measurement per step.
+    
+    The MATLAB robot drives along its local y axis, our robots drive along their x axis. So our heading is the MATLAB
+    heading + pi/2, the local y movement is dForwards, the local x movement (to the right) is -dSideways, and
+    relative angles are the MATLAB bearings - pi/2.
+    """
+    rng = make_random_generator(seed)
+    landmarks = map_size * rng.uniform(0.0, 1.0, (num_features, 2)) - map_size / 2
+    control = numpy.array(ROBOT_CONTROL)
+    
+    # A fixed control drives a circle: pose i is START_POSE composed with the control i + 1 times,
+    # heading goes up by the same amount every step and the movement is that step's control rotated by the old heading.
+    steps = numpy.arange(num_steps + 1)
+    headings = START_POSE[2] + steps * control[2]
+    cos_h = numpy.cos(headings[:-1])
+    sin_h = numpy.sin(headings[:-1])
+    x = START_POSE[0] + numpy.concatenate([[0.0], numpy.cumsum(control[0] * cos_h - control[1] * sin_h)])
+    y = START_POSE[1] + numpy.concatenate([[0.0], numpy.cumsum(control[0] * sin_h + control[1] * cos_h)])
+    poses = numpy.column_stack([x, y, angle_wrap(headings)])[1:]
+    
+    # Odometry: the control every step, composed with noise
+    odometry_noise = numpy.array(ODOMETRY_NOISE) * standard_normal(rng, (num_steps, 3))
+    odometry = tcomp(control, odometry_noise)
+    
+    # Observations: all tries of all steps at once, then keep the first try of every step which passes
+    num_tries = max(int(math.ceil(0.5 * num_features)) - 1, 1)
+    features = random_integers(rng, num_features, (num_steps, num_tries))
+    delta_x = landmarks[features, 0] - poses[:, 0:1]
+    delta_y = landmarks[features, 1] - poses[:, 1:2]
+    ranges = numpy.sqrt(delta_x**2 + delta_y**2) + MEASUREMENT_NOISE[0] * standard_normal(rng, (num_steps, num_tries))
+    bearings = angle_wrap(numpy.arctan2(delta_y, delta_x) - poses[:, 2:3] + MEASUREMENT_NOISE[1] * standard_normal(rng, (num_steps, num_tries)))
+    passed = (numpy.abs(math.pi / 2 - bearings) < field_of_view) & (ranges < sensor_range)
+    first = passed.argmax(1)
+    observed = passed[numpy.arange(num_steps), first]
+    
+    true_positions = numpy.column_stack([poses[:, 0:2], angle_wrap(poses[:, 2] + math.pi / 2)]).tolist()
+    motions = [[0, 0, forwards, -sideways, dtheta, 0] for (sideways, forwards, dtheta) in odometry.tolist()]
+    measurements = [[] for i in xrange(num_steps)]
+    rows = numpy.nonzero(observed)[0]
+    for (i, distance, angle) in zip(rows.tolist(), ranges[rows, first[rows]].tolist(),
+                                    angle_wrap(bearings[rows, first[rows]] - math.pi / 2).tolist()):
+        measurements[i].append([distance, angle, False])
+    return [true_positions, landmarks, motions, measurements]
+
+def run_backend(backend, num_steps = NUM_STEPS, seed = 1):
+    """
+    Runs backend ("EKF" or "GRAPH") offline on the first num_steps steps of the scenario.
+    Returns [run_slam time, mean position error]
+    """
+    # imported here, so generating scenarios does not need the backends
+    from EkfSLAM import EkfSLAM
+    from GraphSLAMInherited import GraphSLAMInherited
+    
+    [true_positions, landmarks, motions, measurements] = generate_scenario(num_steps, seed = seed)
+    if backend == "EKF":
+        slam = EkfSLAM()
+        slam.set_noise_parameters(MEASUREMENT_NOISE[0]**2, MEASUREMENT_NOISE[1]**2, ODOMETRY_NOISE[0])
+    elif backend == "GRAPH":
+        slam = GraphSLAMInherited()
+    else:
+        raise ValueError("Unknown backend " + str(backend) + ", should be EKF or GRAPH")
+    slam.set_offline()
+    for step in xrange(num_steps):
+        slam.send_data(measurements[step], motions[step])
+    
+    # backends print a lot, throw that away
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        start = time.time()
+        output = slam.run_slam()
+        slam_time = time.time() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    
+    poses = numpy.array(output[0], dtype = float)
+    if backend == "GRAPH":
+        # first row is the starting position
+        poses = poses[1:]
+    errors = numpy.sqrt(((poses[:, 0:2] - numpy.array(true_positions)[:, 0:2])**2).sum(1))
+    return [slam_time, errors.mean()]
+
+if __name__ == "__main__":
+    # python EKF_Matlab_Code.py [num_steps], see the table above for what to expect
+    num_steps = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    
+    start = time.time()
+    generate_scenario(NUM_STEPS, seed = 1)
+    print "Generated all %d steps in %.3f s" % (NUM_STEPS, time.time() - start)
+    
+    for backend in ["EKF", "GRAPH"]:
+        [slam_time, error] = run_backend(backend, num_steps)
+        print "%-6s %5d steps: %.2f s, mean position error %.2f" % (backend, num_steps, slam_time, error)
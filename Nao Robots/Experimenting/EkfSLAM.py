@@ -8,6 +8,7 @@ from AbstractSLAMProblem import AbstractSLAMProblem;
 import math;
 import numpy;
 import SLAM;
+import TrajectoryMetrics;
 
 # The square root of the constant below is the minimum distance that needs to separate
 # 2 landmarks for the algorithm to treat them as being different landmarks
@@ -107,7 +108,9 @@ q = movement error term (on command to move 1 unit, robot will move q extra or l
 
 class EkfSLAM(SLAM.SLAM):
     
-    def __init__(self):
+    def __init__(self, association_threshold = ASSOCIATE_LANDMARK_THRESHOLD):
+        # squared distance within which a measurement is associated with a landmark seen before
+        self.association_threshold = association_threshold
         self.num_landmarks_observed = 0
         self.dim = 3
         self.X = numpy.zeros(3)
@@ -165,6 +168,9 @@ class EkfSLAM(SLAM.SLAM):
         
         self.offline = False
         
+        # keep counting up, so anyone holding an old result can see it changed
+        self.data_changed()
+        
         # no need to reset self.A, since the entries which might have changed since initialization will change every step again anyway.
         
         # still do need to reset self.P_top_left
@@ -173,16 +179,19 @@ class EkfSLAM(SLAM.SLAM):
     def send_data(self, measurement_data, motion_data):
         self.measurement_data.append(measurement_data)
         self.motion_data.append(motion_data)
+        self.data_changed()
         
     def set_noise_parameters(self, measurement_noise_range, measurement_noise_bearing, motion_noise):
         self.measurement_noise_range = measurement_noise_range
         self.measurement_noise_bearing = measurement_noise_bearing
         self.motion_noise = motion_noise
+        self.data_changed()
     
     def set_offline(self):
         self.offline = True
         
         self.output = [[], []]
+        self.data_changed()
     
     def set_parameter(self, parameter_name, value):
         raise NotImplementedError("The set_paramter method of this SLAM algorithm has not yet been implemented!")
@@ -198,8 +207,13 @@ class EkfSLAM(SLAM.SLAM):
             measurement_data is a 3 dimensional array where
             measurement_data[i][j] gives [distance(robot, landmark), relative angle] 
             measured at time-step i with respect to the j'th landmark observed at that time-step
+        
+        Returns the same read-only output object as last time if no data came in since then (see SLAM.get_data_version)
         '''
         
+        if(self.result_is_current()):
+            return self.result
+        
         num_steps = len(self.motion_data)
         
         # TODO: debug message, remove this as optimization when everything is confirmed to work correctly
@@ -320,7 +334,7 @@ class EkfSLAM(SLAM.SLAM):
                 landmark_x = self.X[0] + xDistance
                 landmark_y = self.X[1] + yDistance
                 
-                insertLandmark(landmark_x, landmark_y, self.X, reobserved_landmarks, newly_observed_landmarks, distance, relativeAngle, data_landmark[2], self.goal_posts)
+                insertLandmark(landmark_x, landmark_y, self.X, reobserved_landmarks, newly_observed_landmarks, distance, relativeAngle, data_landmark[2], self.goal_posts, self.association_threshold)
                     
             # =============== Step 2: Update state from re-observed landmarks ===============
             for i in xrange(len(reobserved_landmarks)):
@@ -587,9 +601,10 @@ class EkfSLAM(SLAM.SLAM):
 
             self.output = [[rob_pos, landmark_pos]]
         
-        return self.output
+        return self.store_result(self.output)
 
-def insertLandmark(x, y, X, reobserved_landmarks, newly_observed_landmarks, r, bearing, goalPost, goal_posts):
+def insertLandmark(x, y, X, reobserved_landmarks, newly_observed_landmarks, r, bearing, goalPost, goal_posts, 
+                   association_threshold = ASSOCIATE_LANDMARK_THRESHOLD):
     '''
     Inserts a landmark observed at position (x, y) in either the array reobsered_landmarks
     if it was observed before, or newly_observed_landmarks if it was not observed before.
@@ -616,7 +631,7 @@ def insertLandmark(x, y, X, reobserved_landmarks, newly_observed_landmarks, r, b
         dx = x - x_other
         dy = y - y_other
         
-        if((dx*dx + dy*dy) <= ASSOCIATE_LANDMARK_THRESHOLD):
+        if((dx*dx + dy*dy) <= association_threshold):
             reobserved_landmarks.append([x, y, i, r, bearing])
             # print "LANDMARKS ASSOCIATED"
             return
@@ -732,4 +747,9 @@ if __name__ == "__main__":
         for i in xrange(len(landmarks)):
             landmark = landmarks[i]
             print "LANDMARK " + str(i) + " at: (" + str(landmark[0]) + ", " + str(landmark[1]) + ")"
-            print ""
\ No newline at end of file
+            print ""
+    if OFFLINE_SLAM:
+        # summary of the whole run, see TrajectoryMetrics
+        metrics = TrajectoryMetrics.evaluate(output[0], true_robot_positions, output[1][-1], data[1])
+        for name in sorted(metrics.keys()):
+            print name + " = " + str(metrics[name])
@@ -0,0 +1,261 @@
+'''
+Created on 20 Jan 2014
+
+Runs many seeded SLAM trials for every combination in a grid of parameters, spread over a pool of processes.
+
+Every trial is one simulated world from AbstractSLAMProblem, fed to one backend offline. Results (errors and timings)
+end up in a columnar table: a dict of column name -> numpy array, one row per trial. Finished trials are cached on disk
+(one small json file per trial, named after a hash of its parameters and seed), so running a sweep again only
+computes the trials which are missing.
+
+@author: Taghi
+'''
+
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+import numpy
+
+from AbstractSLAMProblem import AbstractSLAMProblem
+from CommonFunctionality import CommonFunctionality
+import EkfSLAM
+from FastSLAM import FastSLAM
+from SEIFSLAM import SEIFSLAM
+from GraphSLAMInherited import GraphSLAMInherited
+import TrajectoryMetrics
+
+BACKENDS = ["EKF", "GRAPH", "FAST", "SEIF"]
+
+# Everything a trial needs. Values missing in a parameter grid are taken from here.
+DEFAULT_PARAMETERS = {
+    "backend" : "GRAPH",
+    "num_steps" : 100,
+    "num_landmarks" : 6,
+    "world_size" : 75.0,
+    "measurement_range" : 50.0,
+    "motion_noise" : 0.1,
+    "measurement_noise" : 0.1,
+    "distance" : 2.0,
+    "association_threshold" : 1.0,
+}
+
+DEFAULT_CACHE_DIR = "experiment_cache"
+
+# A true landmark counts as found when an estimated landmark is at most this far away (after alignment)
+LANDMARK_MATCH_DISTANCE = 5.0
+
+# Part of every cache key. Change it when run_trial starts computing different metrics, so old cached results are not used.
+RESULT_VERSION = 2
+
+# Backends print a lot. Workers throw that away unless this is True.
+SHOW_BACKEND_OUTPUT = False
+
+def make_grid(parameter_grid):
+    '''
+    parameter_grid maps parameter names to lists of values (or single values). Returns a list with one
+    complete parameter dict (see DEFAULT_PARAMETERS) for every combination.
+    '''
+    names = sorted(parameter_grid.keys())
+    values = []
+    for name in names:
+        value = parameter_grid[name]
+        if not isinstance(value, (list, tuple)):
+            value = [value]
+        values.append(value)
+
+    grid = []
+    for combination in itertools.product(*values):
+        parameters = dict(DEFAULT_PARAMETERS)
+        parameters.update(zip(names, combination))
+        grid.append(parameters)
+    return grid
+
+def trial_key(parameters, seed):
+    ''' Name of a trial in the cache '''
+    description = json.dumps([sorted(parameters.items()), seed, RESULT_VERSION])
+    return hashlib.sha1(description).hexdigest()
+
+def make_backend(parameters, seed = None):
+    '''
+    Creates the SLAM backend a trial asks for, with its association threshold and noise set.
+    seed seeds backends which use random numbers (FAST).
+    '''
+    backend = parameters["backend"]
+    threshold = parameters["association_threshold"]
+    if backend == "EKF":
+        slam = EkfSLAM.EkfSLAM(association_threshold = threshold)
+        slam.set_noise_parameters(parameters["measurement_noise"], parameters["measurement_noise"], parameters["motion_noise"])
+    elif backend == "GRAPH":
+        slam = GraphSLAMInherited()
+        slam.associationError = threshold
+        slam.engine = CommonFunctionality(threshold)
+    elif backend == "FAST":
+        slam = FastSLAM(seed = seed, association_threshold = threshold)
+        slam.set_noise_parameters(parameters["measurement_noise"], parameters["measurement_noise"], parameters["motion_noise"])
+    elif backend == "SEIF":
+        slam = SEIFSLAM(association_threshold = threshold)
+        slam.set_noise_parameters(parameters["measurement_noise"], parameters["measurement_noise"], parameters["motion_noise"])
+    else:
+        raise ValueError("Unknown backend " + str(backend) + ", should be one of " + str(BACKENDS))
+    return slam
+
+def estimated_poses(backend, output):
+    '''
+    Returns the estimated [x, y, theta] after every step as a numpy array, from the offline output of a backend
+    '''
+    if backend == "GRAPH":
+        # first row is the starting position
+        return numpy.array(output[0], dtype = float)[1:]
+    return numpy.array(output[0], dtype = float)
+
+def estimated_landmarks(backend, output):
+    '''
+    Returns the final estimated landmarks [x, y, post] as a numpy array, from the offline output of a backend
+    '''
+    if backend == "GRAPH":
+        landmarks = output[1]
+    elif len(output[1]) > 0:
+        # EKF gives the landmarks after every step
+        landmarks = output[1][-1]
+    else:
+        landmarks = []
+    return numpy.array(landmarks, dtype = float).reshape(-1, 3)
+
+def run_trial(trial):
+    '''
+    Runs one trial. trial = (parameters, seed). Returns a dict with the parameters, the seed and the metrics.
+    Module level function so the process pool can pickle it.
+    '''
+    (parameters, seed) = trial
+    stdout = sys.stdout
+    if not SHOW_BACKEND_OUTPUT:
+        sys.stdout = open(os.devnull, "w")
+    try:
+        start = time.time()
+        problem = AbstractSLAMProblem(parameters["world_size"], parameters["measurement_range"], parameters["motion_noise"],
+                                      parameters["measurement_noise"], parameters["num_landmarks"], seed = seed)
+        [true_positions, landmarks, motions, measurements] = problem.run_simulation_vectorized(
+            parameters["num_steps"], parameters["num_landmarks"], parameters["measurement_range"],
+            parameters["motion_noise"], parameters["measurement_noise"], parameters["distance"])
+        simulation_time = time.time() - start
+
+        slam = make_backend(parameters, seed)
+        slam.set_offline()
+        for step in xrange(len(motions)):
+            slam.send_data(measurements[step], motions[step])
+        start = time.time()
+        output = slam.run_slam()
+        slam_time = time.time() - start
+    finally:
+        if sys.stdout is not stdout:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    poses = estimated_poses(parameters["backend"], output)
+    true_positions = numpy.array(true_positions)
+    errors = numpy.sqrt(((poses[:, 0:2] - true_positions[:, 0:2])**2).sum(1))
+
+    result = dict(parameters)
+    result["seed"] = seed
+    result["mean_position_error"] = float(errors.mean())
+    result["final_position_error"] = float(errors[-1])
+    result["max_position_error"] = float(errors.max())
+    # same errors after aligning the trajectory, plus drift and landmark errors (see TrajectoryMetrics)
+    result.update(TrajectoryMetrics.evaluate(poses, true_positions, estimated_landmarks(parameters["backend"], output),
+                                             landmarks[:parameters["num_landmarks"]], max_distance = LANDMARK_MATCH_DISTANCE))
+    result["simulation_time"] = simulation_time
+    result["slam_time"] = slam_time
+    return result
+
+def load_cached(cache_dir, key):
+    filename = os.path.join(cache_dir, key + ".json")
+    if not os.path.exists(filename):
+        return None
+    with open(filename) as cached:
+        return json.load(cached)
+
+def save_cached(cache_dir, key, result):
+    # write to a temporary file first, so an interrupted sweep never leaves half a result in the cache
+    filename = os.path.join(cache_dir, key + ".json")
+    with open(filename + ".tmp", "w") as cached:
+        json.dump(result, cached)
+    os.rename(filename + ".tmp", filename)
+
+def results_table(results):
+    '''
+    Turns a list of result dicts into a columnar table: dict of column name -> numpy array
+    '''
+    table = {}
+    if len(results) == 0:
+        return table
+    for name in sorted(results[0].keys()):
+        table[str(name)] = numpy.array([result[name] for result in results])
+    return table
+
+def run_sweep(parameter_grid, num_trials = 10, first_seed = 0, processes = None, cache_dir = DEFAULT_CACHE_DIR):
+    '''
+    Runs num_trials trials (seeds first_seed, first_seed + 1, ...) for every combination in parameter_grid
+    (see make_grid) on a pool of processes (None = one per cpu) and returns the results table (see results_table),
+    one row per trial in grid order. Every combination gets the same seeds, so they all see the same worlds.
+
+    Trials already in cache_dir are not run again. cache_dir = None turns caching off.
+    '''
+    trials = []
+    for parameters in make_grid(parameter_grid):
+        for seed in xrange(first_seed, first_seed + num_trials):
+            trials.append((parameters, seed))
+
+    results = [None] * len(trials)
+    missing = []
+    if cache_dir is not None:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        for i in xrange(len(trials)):
+            results[i] = load_cached(cache_dir, trial_key(*trials[i]))
+            if results[i] is None:
+                missing.append(i)
+    else:
+        missing = range(len(trials))
+
+    print "Running " + str(len(missing)) + " of " + str(len(trials)) + " trials, rest is cached"
+    if len(missing) > 0:
+        pool = multiprocessing.Pool(processes)
+        try:
+            done = pool.imap(run_trial, [trials[i] for i in missing])
+            for i in missing:
+                results[i] = done.next()
+                if cache_dir is not None:
+                    save_cached(cache_dir, trial_key(*trials[i]), results[i])
+        finally:
+            pool.close()
+            pool.join()
+
+    return results_table(results)
+
+def print_summary(table, group_by):
+    '''
+    Prints mean errors and timings of a results table for every combination of the group_by columns
+    '''
+    if len(table) == 0:
+        return
+    keys = zip(*[table[name].tolist() for name in group_by])
+    for key in sorted(set(keys)):
+        rows = numpy.array([k == key for k in keys])
+        print ", ".join(name + " = " + str(value) for (name, value) in zip(group_by, key))
+        print "    trials: " + str(rows.sum())
+        for column in ["mean_position_error", "final_position_error", "ate_rmse", "rpe_translation_rmse", "landmark_rmse", "slam_time"]:
+            values = table[column][rows]
+            print "    %s: %.4f (std %.4f)" % (column, values.mean(), values.std())
+
+if __name__ == "__main__":
+    grid = {
+        "backend" : BACKENDS,
+        "num_landmarks" : [0, 6],
+        "association_threshold" : [0.1, 1.0],
+    }
+    table = run_sweep(grid, num_trials = 4)
+    print_summary(table, ["backend", "num_landmarks", "association_threshold"])
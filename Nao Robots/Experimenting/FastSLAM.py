@@ -0,0 +1,307 @@
+'''
+Created on 24 Jan 2014
+
+FastSLAM 1.0: a particle filter over robot poses where every particle carries its own map, made of one small 2x2 EKF
+per landmark (Rao-Blackwellization: given the path of a particle, its landmarks are independent of each other).
+
+Particle poses are one numpy array, so moving and weighing all particles is a few numpy operations.
+
+The maps of the particles are persistent binary trees over landmark numbers (see tree_get and tree_set). Changing a
+landmark copies only the path from the root to that landmark, everything else is shared with the old tree. Resampling
+just copies references to roots, so particles drawn more than once share their whole map until one of them changes it.
+A step costs O(M log N) for M particles and N landmarks, where EKF SLAM pays O(N^2) for its covariance matrix.
+
+Data association is done once per measurement, not per particle: the measurement is put on the map with the pose of
+the weighted mean of all particles and looked up in a CommonFunctionality.LandmarkIndex of all landmarks seen so far. Every particle
+then updates (or creates) the same landmark number.
+
+@author: Dennis
+'''
+
+import math
+import numpy
+import SLAM
+from AbstractSLAMProblem import make_random_generator
+from CommonFunctionality import LandmarkIndex, normalize_angles, low_variance_resample
+
+NUM_PARTICLES = 100
+
+# The square root of the constant below is the minimum distance that needs to separate
+# 2 landmarks for the algorithm to treat them as being different landmarks (same as in EkfSLAM)
+ASSOCIATE_LANDMARK_THRESHOLD = 900
+
+# Resample when the effective number of particles drops below this part of all particles
+RESAMPLE_THRESHOLD = 0.5
+
+# Smallest noise used, so zero noise settings don't give singular matrices or identical particles
+MIN_NOISE = 0.000001
+
+'''
+Persistent binary trees.
+
+A tree of depth d holds values for the numbers 0 .. 2^d - 1. A node is a tuple (left, right), a leaf is the value
+itself and None is an empty subtree. Bit d-1 of the number picks the child at the root, bit 0 the child right above the leaf.
+Nodes are never changed, tree_set returns a new root which shares everything except the path to the changed leaf.
+'''
+
+def tree_get(root, depth, index):
+    node = root
+    for level in xrange(depth - 1, -1, -1):
+        if node is None:
+            return None
+        node = node[(index >> level) & 1]
+    return node
+
+def tree_set(root, depth, index, value):
+    ''' Returns the root of a tree which is the tree under root with value at index '''
+    if depth == 0:
+        return value
+    if root is None:
+        root = (None, None)
+    if (index >> (depth - 1)) & 1:
+        return (root[0], tree_set(root[1], depth - 1, index, value))
+    return (tree_set(root[0], depth - 1, index, value), root[1])
+
+def tree_values(root, depth):
+    ''' All values in the tree, in order of their numbers '''
+    if root is None:
+        return []
+    if depth == 0:
+        return [root]
+    return tree_values(root[0], depth - 1) + tree_values(root[1], depth - 1)
+
+class FastSLAM(SLAM.SLAM):
+
+    def __init__(self, num_particles = NUM_PARTICLES, seed = None, association_threshold = ASSOCIATE_LANDMARK_THRESHOLD):
+        self.num_particles = num_particles
+        self.association_threshold = association_threshold
+        self.rng = make_random_generator(seed)
+
+        self.measurement_noise_range = MIN_NOISE
+        self.measurement_noise_bearing = MIN_NOISE
+        self.motion_noise = MIN_NOISE
+
+        self.reset()
+
+    def reset(self):
+        # particle i is at poses[i] = [x, y, theta], has weight weights[i] and map maps[i] (root of a tree of depth map_depth)
+        self.poses = numpy.zeros((self.num_particles, 3))
+        self.weights = numpy.ones(self.num_particles) / self.num_particles
+        self.maps = [None] * self.num_particles
+        self.map_depth = 0
+
+        # rough position of every landmark (where it was first seen) for data association, and whether it is a post
+        self.landmark_index = LandmarkIndex(self.association_threshold)
+        self.goal_posts = []
+
+        self.measurement_data = []
+        self.motion_data = []
+
+        self.offline = False
+        self.output = []
+
+        self.data_changed()
+
+    def send_data(self, measurement_data, motion_data):
+        self.measurement_data.append(measurement_data)
+        self.motion_data.append(motion_data)
+        self.data_changed()
+
+    def set_noise_parameters(self, measurement_noise_range, measurement_noise_bearing, motion_noise):
+        ''' Same meaning as in EkfSLAM: range noise is per unit of distance, motion noise per unit of movement '''
+        self.measurement_noise_range = max(measurement_noise_range, MIN_NOISE)
+        self.measurement_noise_bearing = max(measurement_noise_bearing, MIN_NOISE)
+        self.motion_noise = max(motion_noise, MIN_NOISE)
+        self.data_changed()
+
+    def set_offline(self):
+        self.offline = True
+
+        self.output = [[], []]
+        self.data_changed()
+
+    def set_parameter(self, parameter_name, value):
+        raise NotImplementedError("The set_paramter method of this SLAM algorithm has not yet been implemented!")
+
+    def run_slam(self):
+        '''
+        Runs FastSLAM on the data received since the last run. Same input and output format as EkfSLAM: online
+        [[rob_pos, landmark_pos]] for the last step, offline [[rob_pos per step], [landmark_pos per step]],
+        The robot position is the weighted mean of all particles (see mean_pose), the landmarks come from the map of the
+        particle with the highest weight.
+
+        Returns the same read-only output object as last time if no data came in since then (see SLAM.get_data_version)
+        '''
+        if(self.result_is_current()):
+            return self.result
+
+        if(len(self.motion_data) != len(self.measurement_data)):
+            print "Size of measurement data does not equal size of motion data, should send empty array when no landmarks were observed"
+            return
+
+        # offline output keeps the map root of the best particle, maps are only turned into lists at the end.
+        # The pose is not taken from that particle: right after resampling (and in steps without measurements) all
+        # weights are equal and the best particle is just the first one
+        best_maps = []
+        for step in xrange(len(self.motion_data)):
+            self.move(self.motion_data[step])
+            for measurement in self.measurement_data[step]:
+                self.measure(measurement)
+            self.resample()
+
+            if(self.offline):
+                self.output[0].append(self.mean_pose().tolist())
+                best_maps.append((self.maps[self.weights.argmax()], self.map_depth))
+
+        if(self.offline):
+            for (root, depth) in best_maps:
+                self.output[1].append(self.landmark_list(root, depth))
+        else:
+            best = self.weights.argmax()
+            self.output = [[self.mean_pose().tolist(), self.landmark_list(self.maps[best], self.map_depth)]]
+
+        # only remembering the particles is enough, like in EKF SLAM
+        self.measurement_data = []
+        self.motion_data = []
+
+        return self.store_result(self.output)
+
+    def mean_pose(self):
+        ''' Weighted mean [x, y, theta] of all particles, theta is the mean direction so -pi and pi average to pi '''
+        x = (self.weights * self.poses[:, 0]).sum()
+        y = (self.weights * self.poses[:, 1]).sum()
+        theta = math.atan2((self.weights * numpy.sin(self.poses[:, 2])).sum(), (self.weights * numpy.cos(self.poses[:, 2])).sum())
+        return numpy.array([x, y, theta])
+
+    def move(self, motion_data_step):
+        '''
+        Moves all particles with motion [time,action,dForwards,dSideways,dtheta,speed], each with its own noise.
+        Uses the motion model of EkfSLAM: move with the old orientation, then turn.
+        '''
+        dForwards = motion_data_step[2]
+        dSideways = motion_data_step[3]
+        dtheta = motion_data_step[4]
+
+        # every part of the motion is off by a random factor, like the motion noise of the EKF (which scales with the motion)
+        scale = math.sqrt(self.motion_noise)
+        noise = self.rng.normal(0.0, 1.0, (self.num_particles, 3))
+        forwards = dForwards + (abs(dForwards) * scale + MIN_NOISE) * noise[:, 0]
+        sideways = dSideways + (abs(dSideways) * scale + MIN_NOISE) * noise[:, 1]
+        turn = dtheta + (abs(dtheta) * scale + MIN_NOISE) * noise[:, 2]
+
+        cos_theta = numpy.cos(self.poses[:, 2])
+        sin_theta = numpy.sin(self.poses[:, 2])
+        self.poses[:, 0] += forwards * cos_theta + sideways * sin_theta
+        self.poses[:, 1] += forwards * sin_theta + sideways * cos_theta
+        self.poses[:, 2] = normalize_angles(self.poses[:, 2] + turn)
+
+    def measure(self, measurement):
+        '''
+        Processes one measurement [distance, relative angle, post] in all particles: associates it with a landmark,
+        then either adds that landmark to every map or updates it with a 2x2 EKF per particle and weighs the particles.
+        '''
+        r = measurement[0]
+        bearing = measurement[1]
+        post = measurement[2]
+        R = numpy.array([[r * self.measurement_noise_range, 0.0], [0.0, self.measurement_noise_bearing]])
+
+        # where the particles think this landmark is, on average
+        pose = self.mean_pose()
+        x = pose[0] + r * math.cos(pose[2] + bearing)
+        y = pose[1] + r * math.sin(pose[2] + bearing)
+        landmark = self.landmark_index.nearest(x, y, post)
+
+        if(landmark == -1):
+            self.add_landmark(x, y, r, bearing, post, R)
+        else:
+            self.update_landmark(landmark, r, bearing, R)
+
+    def add_landmark(self, x, y, r, bearing, post, R):
+        ''' Puts a new landmark at distance r and relative angle bearing of every particle '''
+        landmark = len(self.goal_posts)
+        self.landmark_index.insert(x, y, post, landmark)
+        self.goal_posts.append(post)
+
+        # make room: the old tree becomes the left half of a tree twice as big
+        if(landmark == 1 << self.map_depth and landmark > 0):
+            self.maps = [(root, None) for root in self.maps]
+            self.map_depth += 1
+
+        angles = self.poses[:, 2] + bearing
+        cos_a = numpy.cos(angles)
+        sin_a = numpy.sin(angles)
+        means = self.poses[:, 0:2] + r * numpy.column_stack([cos_a, sin_a])
+        # covariance G * R * G^T, with G the jacobian of the landmark position to (r, bearing)
+        G = numpy.empty((self.num_particles, 2, 2))
+        G[:, 0, 0] = cos_a
+        G[:, 0, 1] = -r * sin_a
+        G[:, 1, 0] = sin_a
+        G[:, 1, 1] = r * cos_a
+        covariances = numpy.einsum('pij,jk,plk->pil', G, R, G)
+
+        for i in xrange(self.num_particles):
+            self.maps[i] = tree_set(self.maps[i], self.map_depth, landmark, (means[i], covariances[i]))
+
+    def update_landmark(self, landmark, r, bearing, R):
+        ''' EKF update of landmark in every particle, all particles at once, and weighs particles by the measurement '''
+        means = numpy.empty((self.num_particles, 2))
+        covariances = numpy.empty((self.num_particles, 2, 2))
+        for i in xrange(self.num_particles):
+            (means[i], covariances[i]) = tree_get(self.maps[i], self.map_depth, landmark)
+
+        dx = means[:, 0] - self.poses[:, 0]
+        dy = means[:, 1] - self.poses[:, 1]
+        q = numpy.maximum(dx*dx + dy*dy, MIN_NOISE)
+        predicted_r = numpy.sqrt(q)
+        innovation = numpy.column_stack([r - predicted_r,
+                                         normalize_angles(bearing - (numpy.arctan2(dy, dx) - self.poses[:, 2]))])
+
+        # jacobian of (r, bearing) to the landmark position
+        H = numpy.empty((self.num_particles, 2, 2))
+        H[:, 0, 0] = dx / predicted_r
+        H[:, 0, 1] = dy / predicted_r
+        H[:, 1, 0] = -dy / q
+        H[:, 1, 1] = dx / q
+
+        PHt = numpy.einsum('pij,pkj->pik', covariances, H)
+        S = numpy.einsum('pij,pjk->pik', H, PHt) + R
+        det = S[:, 0, 0] * S[:, 1, 1] - S[:, 0, 1] * S[:, 1, 0]
+        S_inv = numpy.empty_like(S)
+        S_inv[:, 0, 0] = S[:, 1, 1] / det
+        S_inv[:, 0, 1] = -S[:, 0, 1] / det
+        S_inv[:, 1, 0] = -S[:, 1, 0] / det
+        S_inv[:, 1, 1] = S[:, 0, 0] / det
+
+        K = numpy.einsum('pij,pjk->pik', PHt, S_inv)
+        new_means = means + numpy.einsum('pij,pj->pi', K, innovation)
+        new_covariances = covariances - numpy.einsum('pij,pjk->pik', K, numpy.einsum('pij,pjk->pik', H, covariances))
+
+        for i in xrange(self.num_particles):
+            self.maps[i] = tree_set(self.maps[i], self.map_depth, landmark, (new_means[i], new_covariances[i]))
+
+        # weigh by the likelihood of the measurement, in logs first so small likelihoods don't all become 0
+        log_likelihood = -0.5 * numpy.einsum('pi,pij,pj->p', innovation, S_inv, innovation) - 0.5 * numpy.log(numpy.abs(det))
+        weights = self.weights * numpy.exp(log_likelihood - log_likelihood.max())
+        total = weights.sum()
+        if(total > 0 and numpy.isfinite(total)):
+            self.weights = weights / total
+        else:
+            self.weights = numpy.ones(self.num_particles) / self.num_particles
+
+    def resample(self):
+        '''
+        Low variance resampling, when the weights have become too uneven. Maps are shared, not copied.
+        '''
+        effective = 1.0 / (self.weights * self.weights).sum()
+        if(effective >= RESAMPLE_THRESHOLD * self.num_particles):
+            return
+
+        chosen = low_variance_resample(self.weights, self.rng)
+
+        self.poses = self.poses[chosen]
+        self.maps = [self.maps[i] for i in chosen.tolist()]
+        self.weights = numpy.ones(self.num_particles) / self.num_particles
+
+    def landmark_list(self, root, depth):
+        ''' Landmarks of one map (tree of the given depth) as [[x, y, post], ...] in order of their numbers '''
+        return [[mean[0], mean[1], post] for ((mean, covariance), post) in zip(tree_values(root, depth), self.goal_posts)]
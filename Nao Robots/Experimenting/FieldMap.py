@@ -0,0 +1,59 @@
+__author__ = 'redsphinx'
+'''
+The known map of the field we play on, in cm. Used by the map viewer to draw the field, and by
+MonteCarloLocalization to localize on it.
+
+No GUI stuff in here, so anything can import it (MapViewer starts Tk as soon as it is imported).
+'''
+
+import os
+import numpy
+
+# The measures of the field in mm, one "letter value" per line, letters as in the field drawing of the rules:
+# A length and B width of the whole field, E length and F width of the penalty area, G distance from the goal line
+# to the penalty mark
+FIELD_SIZE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "actualfieldsize.txt")
+
+# Distance between the goal posts in cm, not in FIELD_SIZE_FILE
+GOAL_WIDTH = 140
+
+def read_field_size(path = FIELD_SIZE_FILE):
+    ''' Returns {letter : mm} of the field size file '''
+    sizes = {}
+    for line in open(path):
+        parts = line.split()
+        if len(parts) == 2:
+            sizes[parts[0]] = int(parts[1])
+    return sizes
+
+SIZES = read_field_size()
+
+# size of the part of the field on the map (our half, the goal line along x), in cm
+FIELD_LENGTH = SIZES["B"] / 10
+FIELD_WIDTH = SIZES["A"] / 20
+PENALTY_AREA_LENGTH = SIZES["E"] / 10
+PENALTY_AREA_WIDTH = SIZES["F"] / 10
+PENALTY_MARK_DISTANCE = SIZES["G"] / 10
+
+# all actual coordinates of the cornerpoints on the field: the corners of the field and the penalty area, the middle
+# of the center line (I) and the penalty mark (J)
+A = [0, 0]
+B = [(FIELD_LENGTH - PENALTY_AREA_WIDTH) / 2, 0]
+C = [B[0], PENALTY_AREA_LENGTH]
+D = [B[0] + PENALTY_AREA_WIDTH, PENALTY_AREA_LENGTH]
+E = [D[0], 0]
+F = [FIELD_LENGTH, 0]
+G = [FIELD_LENGTH, FIELD_WIDTH]
+H = [0, FIELD_WIDTH]
+I = [FIELD_LENGTH / 2, FIELD_WIDTH]
+J = [FIELD_LENGTH / 2, PENALTY_MARK_DISTANCE]
+K = [(FIELD_LENGTH - GOAL_WIDTH) / 2, 0]
+L = [K[0] + GOAL_WIDTH, 0]
+ACT_LNDMRKS = [A, B, C, D, E, F, G, H, J, K, L]
+
+# K and L are the (yellow) goal posts, the rest are corners of lines
+GOAL_POSTS = [K, L]
+
+# the landmarks as numpy arrays: positions[i] = [x, y], is_post[i] = True for goal posts
+LANDMARK_POSITIONS = numpy.array(ACT_LNDMRKS, dtype = float)
+LANDMARK_IS_POST = numpy.array([landmark in GOAL_POSTS for landmark in ACT_LNDMRKS])
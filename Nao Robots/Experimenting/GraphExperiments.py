@@ -7,6 +7,8 @@ This class contains test cases for Graph SLAM algorithm.
 '''
 
 from GraphSLAM import *
+import time
+import ExperimentRunner
 
 def test_1():
     num_steps = 100
@@ -79,6 +81,52 @@ def test_6():
     slam = GraphSLAM()
     slam.slam_experiment(num_steps, num_landmarks, world_size, measurement_range, motion_noise, measurement_noise, distance, ASSOCIATE_LANDMARK_THRESHOLD)
 
+def sweep_tests(num_trials = 20, processes = None):
+    '''
+    Runs the scenarios of test_3 ... test_6 as a Monte Carlo sweep (num_trials seeded worlds each, on a process pool)
+    and returns the results table instead of printing a single run. See ExperimentRunner.
+    '''
+    no_noise = {"num_steps" : 100, "world_size" : 75, "measurement_range" : 50, "distance" : 2,
+                "motion_noise" : 0.000001, "measurement_noise" : 0.00001}
+    grid = dict(no_noise)
+    grid["num_landmarks"] = 6
+    grid["association_threshold"] = [0.0, 0.001, 0.1, 1.0]
+    table = ExperimentRunner.run_sweep(grid, num_trials, processes = processes)
+    ExperimentRunner.print_summary(table, ["association_threshold"])
+    return table
+
+def benchmark_pre_process(num_steps = 10000, num_landmarks = 20, error = 100):
+    '''
+    Times pre processing of a num_steps long simulated log, once through the list interface
+    (make_data, which flattens the lists first) and once straight on numpy arrays.
+    '''
+    world_size = 75
+    measurement_range = 30
+    motion_noise = 0.1
+    measurement_noise = 0.1
+    distance = 2
+    simulation = AbstractSLAMProblem(world_size, measurement_range, motion_noise, measurement_noise, num_landmarks)
+    simulation.run_simulation_dennis(num_steps, num_landmarks, world_size, measurement_range, motion_noise, measurement_noise, distance)
+    gabi_array = simulation.observed_motions
+    roel_array = simulation.observed_measurements
+    
+    start = time.time()
+    engine = CommonFunctionality(error)
+    data = engine.make_data(gabi_array, roel_array)
+    list_time = time.time() - start
+    
+    motions = motion_columns(gabi_array)
+    measurement_table = flatten_measurements(roel_array)
+    start = time.time()
+    engine = CommonFunctionality(error)
+    engine.pre_process_arrays(motions, measurement_table, 0, 0)
+    array_time = time.time() - start
+    
+    print str(len(data)) + " steps, " + str(len(measurement_table)) + " measurements, " + str(len(engine.landmarks)) + " landmarks"
+    print "make_data (lists):          %.3f s" % list_time
+    print "pre_process_arrays (numpy): %.3f s" % array_time
+    return [list_time, array_time]
+
 
 if __name__ == "__main__":
     # Here we will call one of the test cases. Just comment out whichever you want to run.
@@ -87,4 +135,6 @@ if __name__ == "__main__":
     test_3()
     #test_4()
     #test_5()
-    #test_6()
\ No newline at end of file
+    #test_6()
+    #sweep_tests()
+    #benchmark_pre_process()
\ No newline at end of file
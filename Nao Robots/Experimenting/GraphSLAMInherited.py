@@ -4,6 +4,7 @@ Created on 9 Jan 2014
 @author: Taghi
 '''
 import SLAM
+import math
 from GraphSLAM import GraphSLAM
 import numpy as np
 from CommonFunctionality import CommonFunctionality
@@ -21,6 +22,8 @@ class GraphSLAMInherited(SLAM.SLAM):
         self.measurement_noise = 2.0
         self.associationError = 400
         self.method = True
+        # Keeps pre processed data between runs, so every run only pre processes new steps
+        self.engine = CommonFunctionality(self.associationError)
         print "Graph Slam is initialized!"
     
     def reset(self):
@@ -33,12 +36,18 @@ class GraphSLAMInherited(SLAM.SLAM):
         self.measurement_noise = 2.0
         self.associationError = 400
         self.method = True
+        self.engine = CommonFunctionality(self.associationError)
+        # keep counting up, so anyone holding an old result can see it changed
+        self.data_changed()
         print "Reseting done!"
         
     def run_slam(self):
+        # Nothing new since the last run (for example a failed capture), so the result is still the same
+        if self.result_is_current():
+            return self.result
         # TODO : Needs to be tested somehow.
         print "Running graph slam!"
-        engine = CommonFunctionality(self.associationError)
+        engine = self.engine
         data = engine.make_data(self.motions,self.measurements)
         [result,booleans] = self.graphSlam.graphSlam(data,len(data) + 1,len(engine.landmarks),self.motion_noise,self.measurement_noise)
         # Getting all the results.
@@ -58,8 +67,8 @@ class GraphSLAMInherited(SLAM.SLAM):
                 #motion_approximations.append([result[2*k],result[2*k+1],data[k][1][0][2]])
                 
             for i in range(len(engine.landmarks)):
-                landmarks_approximations[i][0] = result[2*(len(self.motions) + i)]
-                landmarks_approximations[i][1] = result[2*(len(self.motions) + i) + 1]
+                landmarks_approximations[i][0] = result[2*(len(self.motions) + 1 + i)]
+                landmarks_approximations[i][1] = result[2*(len(self.motions) + 1 + i) + 1]
                 #print booleans[i]
                 landmarks_approximations[i][2] = booleans[i]
                 #landmarks_approximations.append([result[2*(len(self.motions)+i)],result[2*(len(self.motions)+i) + 1]])
@@ -74,19 +83,20 @@ class GraphSLAMInherited(SLAM.SLAM):
             motion_approximations[0][2] = data[len(self.motions) - 1][1][0][2]
 
             for i in range(len(engine.landmarks)):
-                landmarks_approximations[i][0] = result[2*(len(self.motions) + i)]
-                landmarks_approximations[i][1] = result[2*(len(self.motions) + i) + 1]
+                landmarks_approximations[i][0] = result[2*(len(self.motions) + 1 + i)]
+                landmarks_approximations[i][1] = result[2*(len(self.motions) + 1 + i) + 1]
                 #print booleans[i]
                 landmarks_approximations[i][2] = booleans[i]
         
         # Returning results depending on what method is used. Return statement does not change only the way matrices are generated 
         print "Graph SLAM is done!"
         #return result
-        return np.array([motion_approximations,landmarks_approximations])
+        return self.store_result(np.array([motion_approximations,landmarks_approximations]))
     
     def send_data(self,measurement_data,motion_data):
         self.measurements.append(measurement_data)
         self.motions.append(motion_data) 
+        self.data_changed()
         
     def set_parameter(self,parameter_name,value):
         print "Setting some parameter for graph slam!"
@@ -95,7 +105,40 @@ class GraphSLAMInherited(SLAM.SLAM):
     def set_noise_parameters(self,measurement_noise_range,measurement_noise_bearing,motion_noise):
         self.motion_noise = 2.0
         self.measurement_noise = 2.0
+        self.data_changed()
         
     def set_offline(self):
         self.method = False
-    
\ No newline at end of file
+        self.data_changed()
+    
+
+def check_landmark_indices():
+    '''
+    Noise free run to check run_slam reads the landmarks from the right place in the GraphSLAM result. The robot
+    walks straight ahead along the x axis and sees two landmarks, which are far enough apart not to be associated.
+    
+    The result of GraphSLAM holds len(motions) + 1 poses before the landmarks, so landmark i starts at index 
+    2*(len(motions) + 1 + i). Reading it from 2*(len(motions) + i) gives the last pose as landmark 0, and every 
+    other landmark one place off.
+    
+    Returns True if the estimated landmarks are the true ones.
+    '''
+    true_landmarks = [[10.0, 30.0], [5.0, -30.0]]
+    slam = GraphSLAMInherited()
+    slam.set_offline()
+    x = 0.0
+    for k in range(5):
+        # measurements are taken from the pose before the motion of the same step
+        measurements = [[math.hypot(lx - x, ly), math.atan2(ly, lx - x), False] for (lx, ly) in true_landmarks]
+        slam.send_data(measurements, [0, 0, 2.0, 0, 0.0, 0])
+        x += 2.0
+    landmarks = slam.run_slam()[1]
+    print "Estimated landmarks: " + str(landmarks[:, 0:2].tolist())
+    print "True landmarks: " + str(true_landmarks)
+    return len(landmarks) == len(true_landmarks) and np.allclose(landmarks[:, 0:2], true_landmarks)
+
+if __name__ == "__main__":
+    if check_landmark_indices():
+        print "Landmark indices OK"
+    else:
+        print "Landmark indices WRONG"
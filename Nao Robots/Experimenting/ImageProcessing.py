@@ -3,14 +3,27 @@ import cv2
 import numpy as np
 from PIL import Image
 import ColorSysCustom as csc
+import ColorTable
 from cv2 import cv
 
 class ImageProcessing():
     
-    def __init__(self, imgString): 
-        imgTemp = Image.open(imgString)
-        self.height, self.width = imgTemp.size
-        self.img = cv2.imread(imgString)
+    def __init__(self, image): 
+        '''
+        image is the picture as a numpy array of B, G, R bytes (rows x columns x 3), for example Vision.getFrame().
+        A file name also works, then the picture is read from that file. The array is copied, processing changes it.
+        A YUV422 picture straight from the camera (rows x columns x 2, see Vision) is classified directly on its
+        Y, U and V, see ColorTable.
+        '''
+        if isinstance(image, basestring):
+            image = cv2.imread(image)
+        self.img = np.array(image, dtype = np.uint8, order = 'C')
+        #Y, U, V for every pixel instead of B, G, R, until classified
+        self.yuv = self.img.shape[2] == 2
+        if self.yuv:
+            self.img = ColorTable.yuv422_to_yuv(self.img)
+        #same names as before: height is the number of columns, width the number of rows
+        self.width, self.height = self.img.shape[0:2]
         self.maxSpacing = 10
         self.minYellow = 100
         self.goalpostSpacingSquared = 50*50
@@ -18,26 +31,57 @@ class ImageProcessing():
         self.UPPER_BOUND_GREEN = 0.85
         self.LOWER_BOUND_YELLOW = 0.08333
         self.UPPER_BOUND_YELLOW = 0.25
+        self.colorTableBits = ColorTable.DEFAULT_BITS
+        #first row which is processed, see setFieldTop
+        self.top = 0
+        #only these parts of the image are processed, see setWindows
+        self.windows = None
+        #scanline mode, see startScanlines
+        self.scanlineStride = 4
+        self.horizontalScanlines = 8
+        self.maxLineWidth = 30
+        self.lineGreenGap = 2
+        self.minSegmentPoints = 3
+        self.maxSegmentSlope = 2.0
+        self.maxSegmentBend = 0.3
                
                 
-    # width of image, height of image, image, fraction of the image to be randomly taken pixels from            
-    def getAverageLightIntensity(self, width, height, img, fractionOfImage):   
-        sum = 0;
-        self.n = np.int(fractionOfImage*width*height)
-            
-        randomsX = np.random.uniform(0, np.int(width), size = self.n)
-        randomsY = np.random.uniform(0, np.int(height), size = self.n)
+    # width of image, height of image, image, fraction of the image to take pixels from
+    def getAverageLightIntensity(self, width, height, img, fractionOfImage):
+        '''
+        Sets Lic to the average luminance (0-1) of the image, from a regular grid of pixels: every step-th pixel of
+        every step-th row, with step chosen so at least fractionOfImage of all pixels are used. Luminance of a pixel is
+        (min(R,G,B) + max(R,G,B))/2, as in ColorSysCustom.rgb_to_luminance.
+        '''
+        step = max(1, np.int(1.0/np.sqrt(fractionOfImage)))
+        sample = img[0:np.int(width):step, 0:np.int(height):step]
+        self.n = sample.shape[0]*sample.shape[1]
         
-        for i in xrange(0, self.n):   
-            B, G, R = img[randomsX[i]][randomsY[i]]
-                
-             #fitting them for HSV transform
-            R = np.double(R)/255
-            G = np.double(G)/255
-            B = np.double(B)/255
-            L = csc.rgb_to_luminance(R, G, B)
-            sum = sum + L
-        self.Lic = (sum/self.n)
+        if self.yuv:
+            self.Lic = ColorTable.yuv_luminance(sample).mean()/255.0
+        else:
+            #min + max of a pixel is at most 510, so this fits in 16 bits
+            levels = sample.min(2).astype(np.uint16) + sample.max(2)
+            self.Lic = levels.mean()/510.0
+        
+        
+    def setFieldTop(self, fieldTop, margin = 0):
+        '''
+        Tells that rows above fieldTop can't contain the field (for example because they are above the horizon). Only
+        the rows from margin above fieldTop are classified then, the rest becomes black. The margin is where the
+        goalposts standing on the field reach above fieldTop, see Distance.goalpostMargin. Call before startLumi.
+        '''
+        self.top = min(max(0, np.int(fieldTop) - np.int(margin)), self.width)
+        
+        
+    def setWindows(self, windows):
+        '''
+        Only looks at the pixels in windows, a list of [top, bottom, left, right] (rows top until bottom, columns left
+        until right), for example around the places where LandmarkTracker expects the landmarks. Everything outside
+        them becomes black and there is no background removal: the windows are on the field already.
+        None processes the whole image again. Call before startLumi.
+        '''
+        self.windows = windows
         
         
     def setThreshold(self, t):
@@ -52,77 +96,109 @@ class ImageProcessing():
         self.new_img = Image.new('RGB', (self.height, self.width), "black")
         #pixels = self.img.load()
         
-        for x in xrange(0, self.width):
-            for y in xrange(0, self.height):
-                B, G, R = self.img[x][y]
-               
-                #Getting the Hue and Lum
-                R = np.double(R)/255
-                G = np.double(G)/255
-                B = np.double(B)/255
-                H = csc.rgb_to_hue(R, G, B)
-                Y = csc.rgb_to_luminance(R, G, B)
-                
-                
-                #accepted white
-                if(self.acceptedLumi(Y*255)):
-                    self.img[x, y] = (255,255,255)
-                elif(self.acceptedYellow(H)):
-                    self.img[x, y] = (255,0,0)
-                elif(self.acceptedGreen(H)):
-                    self.img[x, y] = (0,255,0)
-                else:
-                    self.img[x, y] = (0, 0, 0)
+        if self.windows is not None:
+            self.classifyWindows()
+            self.calculateGoalposts()
+            self.onlyWhite()
+            return
+        
+        self.classifyImage()
                     
         self.calculateGoalposts()
         self.removeBackGround()
 
 
+    def classifyImage(self):
+        '''
+        Labels every pixel of the image white (255,255,255), yellow (255,0,0), green (0,255,0) or black, for the
+        whole image at once. Same result as checking acceptedLumi, acceptedYellow and acceptedGreen (in that order)
+        for every pixel, but looked up in a table of all colours (see ColorTable) which is only made again when
+        the hue bounds change. colorTableBits < 8 uses a smaller, approximate table.
+        '''
+        region = self.img[self.top:]
+        region[:, :] = ColorTable.LABEL_COLORS[self.colorLabels(region)]
+        self.img[:self.top] = (0, 0, 0)
+        self.yuv = False
+
+
+    def colorLabels(self, region):
+        '''
+        ColorTable labels of the pixels of region (part of self.img), from the table for the current hue bounds, with
+        the white test for the current threshold and Lic. YUV pictures are classified on their Y, U and V, see 
+        ColorTable.classify_yuv.
+        '''
+        if self.yuv:
+            table = ColorTable.get_yuv_table((self.LOWER_BOUND_YELLOW, self.UPPER_BOUND_YELLOW),
+                                             (self.LOWER_BOUND_GREEN, self.UPPER_BOUND_GREEN))
+            return ColorTable.classify_yuv(region, table, self.threshold + (255-self.threshold)*self.Lic)
+        
+        table = ColorTable.get_table((self.LOWER_BOUND_YELLOW, self.UPPER_BOUND_YELLOW),
+                                     (self.LOWER_BOUND_GREEN, self.UPPER_BOUND_GREEN), self.colorTableBits)
+        return ColorTable.classify(region, table, ColorTable.white_level(self.threshold, self.Lic))
+
+
+    def classifyWindows(self):
+        '''
+        classifyImage for only the pixels in self.windows, the rest of the image becomes black
+        '''
+        labelled = np.zeros_like(self.img)
+        for [top, bottom, left, right] in self.windows:
+            region = self.img[top:bottom, left:right]
+            labelled[top:bottom, left:right] = ColorTable.LABEL_COLORS[self.colorLabels(region)]
+        self.img = labelled
+        self.yuv = False
+
+
     def calculateGoalposts(self):
+        '''
+        Finds the bottom of the goalposts: in every column (except 20 pixels at both sides) the lowest run of more
+        than minYellow yellow pixels which stands on 3 green pixels. The goalpost is the first green pixel under it.
+        Goalposts closer than goalpostSpacing to one found before (from left to right) are the same goalpost.
+        More than 2 goalposts can't be right, then there are none.
+        
+        Works on the whole image at once: the length of the yellow run up to every pixel comes from the index of the
+        last non yellow pixel above it, and the green check from the green mask shifted 1, 2 and 3 rows up.
+        '''
+        columns = self.img[self.top:, 20:self.height-20]
+        yellow = (columns[:, :, 2] == 0) & (columns[:, :, 0] == 255)
+        green = (columns[:, :, 0] == 0) & (columns[:, :, 1] == 255)
+        self.findGoalposts(yellow, green, np.arange(20, self.height-20))
         
+        
+    def findGoalposts(self, yellow, green, xs):
+        '''
+        The goalpost search of calculateGoalposts on yellow and green masks of image columns xs (from row top)
+        '''
         self.goalposts = []
         self.goalpostsTemp = []
         
-        for x in xrange(20, self.height-20):
-            count = 0
-            for y in xrange(0, self.width):
-                #reverse y
-                yy = self.width-y-1
-                B, G, R = self.img[yy][x]
-                #if goalpost pixel
-                if(R == 0 and B == 255):
-                    if (count == 0):
-                        if (yy+3 < self.width):
-                            B1, G1, R1 = self.img[yy+1][x]
-                            B2, G2, R2 = self.img[yy+2][x]
-                            B3, G3, R3 = self.img[yy+3][x]
-                            #if either one of the previous ones are green
-                            if((B1 == 0 and G1 == 255) and (B2 == 0 and G2 == 255) and (B3 == 0 and G3 == 255)):
-                                count = count + 1
-                    else:
-                        count = count + 1
-                        if(count > self.minYellow):
-                            self.goalpostsTemp.append([x, yy+count])
-                            break
-                else:
-                    count = 0
+        rows = len(yellow)
+        if rows < 4 or len(xs) == 0:
+            return
         
-        #removing points close to each other
-        if (len(self.goalpostsTemp) > 0):
-            
-            self.goalposts.append(self.goalpostsTemp[0])
-            
-            for i in xrange(1, len(self.goalpostsTemp)):
-                xt, yt = self.goalpostsTemp[i]
-                double = False
-                for j in xrange(0, len(self.goalposts)):
-                    x, y = self.goalposts[j]
-                    if((x-xt)*(x-xt) + (y-yt)*(y-yt) < self.goalpostSpacingSquared):
-                        double = True
-                        break
-                if(double is False):
-                    self.goalposts.append(self.goalpostsTemp[i])
+        #length of the run of yellow pixels ending (from above) in every pixel
+        index = np.arange(rows)[:, np.newaxis]
+        lastNotYellow = np.maximum.accumulate(np.where(yellow, -1, index), axis = 0)
+        yellowRun = index - lastNotYellow
+        
+        #bottom of a long enough yellow run, with 3 green pixels under it
+        bottoms = (yellowRun[:rows-3] > self.minYellow) & green[1:rows-2] & green[2:rows-1] & green[3:rows]
+        found = bottoms.any(0)
+        lowest = (rows-4) - np.argmax(bottoms[::-1], axis = 0)
+        for x in np.flatnonzero(found):
+            self.goalpostsTemp.append([int(xs[x]), int(lowest[x]) + 1 + self.top])
         
+        #removing points close to each other
+        for [xt, yt] in self.goalpostsTemp:
+            double = False
+            for [x, y] in self.goalposts:
+                if((x-xt)*(x-xt) + (y-yt)*(y-yt) < self.goalpostSpacingSquared):
+                    double = True
+                    break
+            if(double is False):
+                self.goalposts.append([xt, yt])
+                if (len(self.goalposts) > 2):
+                    break
         
         if (len(self.goalposts) > 2):
             self.goalposts = []
@@ -132,30 +208,151 @@ class ImageProcessing():
         return self.goalposts
 
     def removeBackGround(self):
+        '''
+        Makes everything above the field and everything which is not white black, and returns the field boundary:
+        for every column the first row of the topmost run of more than maxSpacing green pixels, or the height of the
+        image if the column has no such run (then the whole column is background). Also kept in self.fieldBoundary,
+        later steps can use it to only look at the field.
+        
+        Works on the whole image at once (from row top, see setFieldTop), the length of the green run up to every
+        pixel comes from the index of the last non green pixel above it.
+        '''
         #self.white_list = []
         
-        w = self.getHeightImage()
         h = self.getWidthImage()
-        for x in xrange(0, w):
-            count = 0
-            
-            for y in xrange(0, h):
-                B, G, R = self.img[y][x]
-                if(B == 0 and G == 255):
-                    count = count + 1
-                else:
-                    count = 0
-                if(count > self.maxSpacing):
-                    for r in xrange(0, y-count+1):
-                        self.img[r, x] = (0, 0, 0)
-                    break
-            if(count <= self.maxSpacing):
-                for y in xrange(0, h):
-                    self.img[y, x] = (0, 0, 0)
-                
+        green = (self.img[self.top:, :, 0] == 0) & (self.img[self.top:, :, 1] == 255)
+        self.fieldBoundary = self.findFieldBoundary(green)
+        
         #self.clusterImage()
-        self.onlyWhite()
+        self.onlyWhite(np.arange(h)[:, np.newaxis] >= self.fieldBoundary)
         #self.abstractImage()
+        return self.fieldBoundary
+        
+    def findFieldBoundary(self, green):
+        '''
+        The field boundary of removeBackGround for every column of the green mask green (from row top)
+        '''
+        h = self.top + len(green)
+        index = np.arange(self.top, h)[:, np.newaxis]
+        lastNotGreen = np.maximum.accumulate(np.where(green, self.top-1, index), axis = 0)
+        longRun = (index - lastNotGreen) > self.maxSpacing
+        
+        #the run reaches maxSpacing + 1 pixels maxSpacing rows below its start
+        return np.where(longRun.any(0), self.top + np.argmax(longRun, axis = 0) - self.maxSpacing, h)
+    
+    
+    def startScanlines(self):
+        '''
+        Fast alternative for startLumi: only classifies the pixels on vertical scanlines every scanlineStride columns
+        and on horizontalScanlines rows, and looks for changes of colour along them:
+            - goalposts: the search of calculateGoalposts on the vertical scanlines
+            - field lines: short runs of white between green (green -> white -> green) below the field boundary.
+              The middle points of these runs on neighbouring scanlines are joined into line segments, which are
+              split where the line bends, so a corner becomes the shared end of two segments.
+        The image itself is not changed. Results are in getGoalposts and getSegments, segments in the format of
+        cv2.HoughLinesP: [x1, y1, x2, y2] per segment.
+        '''
+        h = self.getWidthImage()
+        self.segments = np.zeros((0, 4), dtype = np.int32)
+        
+        #vertical scanlines: labels[row - top, scanline]
+        xs = np.arange(self.scanlineStride/2, self.height, self.scanlineStride)
+        labels = self.colorLabels(self.img[self.top:, xs])
+        green = labels == ColorTable.GREEN
+        inside = (xs >= 20) & (xs < self.height-20)
+        self.findGoalposts((labels == ColorTable.YELLOW)[:, inside], green[:, inside], xs[inside])
+        self.fieldBoundary = self.findFieldBoundary(green)
+        
+        [rows, scanlines] = self.lineCrossings(labels)
+        rows = rows + self.top
+        onField = rows >= self.fieldBoundary[scanlines]
+        segments = self.joinCrossings(scanlines[onField], rows[onField], self.scanlineStride)
+        points = [[[xs[scanline], row] for [scanline, row] in segment] for segment in segments]
+        
+        #horizontal scanlines between row top and the bottom, for the steep lines: labels[column, scanline]
+        ys = np.linspace(self.top, h-1, self.horizontalScanlines+2)[1:-1].astype(np.int)
+        if len(ys) > 0 and h > self.top:
+            labels = self.colorLabels(self.img[ys]).T
+            [columns, scanlines] = self.lineCrossings(labels)
+            nearest = np.minimum(columns/self.scanlineStride, len(xs)-1)
+            onField = ys[scanlines] >= self.fieldBoundary[nearest]
+            spacing = max(1, (h-self.top)/(self.horizontalScanlines+1))
+            segments = self.joinCrossings(scanlines[onField], columns[onField], spacing)
+            points += [[[column, ys[scanline]] for [scanline, column] in segment] for segment in segments]
+        
+        if (len(points) > 0):
+            self.segments = np.array([segment[0] + segment[-1] for segment in points], dtype = np.int32)
+        return self.segments
+    
+    
+    def lineCrossings(self, labels):
+        '''
+        Finds field lines crossing scanlines: labels has the ColorTable labels of one scanline per column. Returns
+        [positions, scanlines], the middle of every run of at most maxLineWidth white pixels with green at most
+        lineGreenGap pixels before and after it, and the scanline (column of labels) it is on.
+        '''
+        n = len(labels)
+        white = labels == ColorTable.WHITE
+        green = labels == ColorTable.GREEN
+        greenBefore = np.zeros_like(green)
+        greenAfter = np.zeros_like(green)
+        for d in xrange(1, min(self.lineGreenGap, n-1) + 1):
+            greenBefore[d:] |= green[:-d]
+            greenAfter[:-d] |= green[d:]
+        
+        #+1 where a white run starts, -1 one pixel after it ends, both found in the same order
+        padded = np.zeros((n+2, labels.shape[1]), dtype = np.int8)
+        padded[1:-1] = white
+        change = padded[1:] - padded[:-1]
+        [startScanlines, starts] = np.nonzero((change == 1).T)
+        ends = np.nonzero((change == -1).T)[1] - 1
+        
+        keep = ((ends - starts) < self.maxLineWidth) & greenBefore[starts, startScanlines] & greenAfter[ends, startScanlines]
+        return [(starts[keep] + ends[keep])/2, startScanlines[keep]]
+    
+    
+    def joinCrossings(self, scanlines, positions, spacing):
+        '''
+        Joins line crossings on neighbouring scanlines (spacing pixels apart) into segments: a crossing continues
+        the closest segment which ended on the previous scanline, if that keeps its slope below maxSegmentSlope.
+        A segment which bends more than maxSegmentBend radians is ended and a new one starts at its last point.
+        Returns the segments with at least minSegmentPoints points, as lists of [scanline, position].
+        '''
+        finished = []
+        active = []
+        maxJump = self.maxSegmentSlope * spacing
+        for scanline in np.unique(scanlines):
+            extended = []
+            for position in positions[scanlines == scanline]:
+                best = None
+                for segment in active:
+                    [lastScanline, lastPosition] = segment[-1]
+                    if (lastScanline == scanline-1 and abs(position - lastPosition) <= maxJump and
+                        (best is None or abs(position - lastPosition) < abs(position - best[-1][1]))):
+                        best = segment
+                if best is None:
+                    extended.append([[scanline, position]])
+                    continue
+                active.remove(best)
+                
+                #direction of the segment so far and of the new step
+                if (len(best) > 1):
+                    angle = np.arctan2(best[-1][1] - best[0][1], (best[-1][0] - best[0][0])*spacing)
+                    step = np.arctan2(position - best[-1][1], spacing)
+                    if (abs(angle - step) > self.maxSegmentBend):
+                        finished.append(best)
+                        best = [best[-1]]
+                best.append([scanline, position])
+                extended.append(best)
+            finished += active
+            active = extended
+        finished += active
+        return [segment for segment in finished if len(segment) >= self.minSegmentPoints]
+        
+        
+    def getSegments(self):
+        return self.segments
+        
         
     '''
     def clusterImage(self):
@@ -293,12 +490,14 @@ class ImageProcessing():
             self.img[self.clusterpoins[c][1], self.clusterpoins[c][0]] = (255, 255, 255)
     '''    
         
-    def onlyWhite(self):
-        for x in xrange(0, self.getWidthImage()):
-            for y in xrange(0, self.getHeightImage()):
-                B, G, R = self.img[x][y]
-                if not(B == 255 and G == 255):
-                    self.img[x, y] = (0, 0, 0)
+    def onlyWhite(self, field = None):
+        '''
+        Makes every pixel which is not white black, and when a boolean mask field is given also every pixel outside it
+        '''
+        keep = (self.img[:, :, 0] == 255) & (self.img[:, :, 1] == 255)
+        if field is not None:
+            keep &= field
+        self.img[~keep] = (0, 0, 0)
     
     
     def acceptedLumi(self, Y):
@@ -0,0 +1,128 @@
+'''
+Created on 5 Feb 2014
+
+Follows the landmarks (goalposts and line corners) of the last picture into the next one, so the next picture only
+has to be searched in small windows instead of completely.
+
+Between two pictures the robot made one known motion [time, action, dForwards, dSideways, dtheta, speed] and the head
+angle is known. The landmarks of the last picture, measured as [distance (cm), angle (rad), post] by Distance, are
+moved with the opposite of that motion and projected into the new picture with the camera model of
+Distance.calculateStuff. Distance then only looks in a window around every predicted landmark (goalposts get a taller
+window, the whole yellow run above the bottom of the post has to be in it).
+
+When less than MIN_TRACKED of the predicted landmarks are found again, nothing was predicted, or the last full search
+was FULL_SEARCH_INTERVAL pictures ago (to find new landmarks), the whole picture is searched.
+
+@author: Dennis
+'''
+
+import math
+import cv2
+import Distance as distance
+# camera model of Distance.calculateStuff, imagePosition is its inverse
+from Distance import FOVHOR, FOVVER, DEG2RAD
+
+# Size in pixels of the window around a predicted landmark
+WINDOW_SIZE = 80
+
+# Rows of yellow above the bottom of a goalpost which are searched too, more than ImageProcessing.minYellow
+GOALPOST_WINDOW_HEIGHT = 120
+
+# Part of the predicted landmarks that has to be found again, otherwise the whole picture is searched
+MIN_TRACKED = 0.5
+
+# Search the whole picture at least once every this many pictures
+FULL_SEARCH_INTERVAL = 10
+
+class LandmarkTracker:
+
+    def __init__(self):
+        # landmarks of the last picture [distance, angle, post]
+        self.landmarks = []
+        self.picturesSinceFullSearch = 0
+        self.tracked = False
+
+    def reset(self):
+        ''' Forgets the landmarks, the next picture is searched completely '''
+        self.landmarks = []
+        self.picturesSinceFullSearch = 0
+
+    def analyse(self, image, motion, a, cameraHeight, sparse = False):
+        '''
+        Finds the landmarks in image, taken after motion with head angle a (degrees, like Distance) and camera height
+        cameraHeight (m). Returns the data of Distance: [distance, angle, post] for every landmark.
+        tracked tells afterwards if only the windows were searched.
+        '''
+        if isinstance(image, basestring):
+            # read here already, the predictions need the size of the picture
+            image = cv2.imread(image)
+        rows, columns = image.shape[0:2]
+
+        self.tracked = False
+        self.picturesSinceFullSearch += 1
+        predictions = []
+        if motion is not None and self.picturesSinceFullSearch < FULL_SEARCH_INTERVAL:
+            predictions = self.predict(motion, a, cameraHeight, rows, columns)
+
+        if len(predictions) > 0:
+            data = distance.Distance(image, a, cameraHeight, sparse, self.windows(predictions, rows, columns)).getData()
+            if len(data) >= MIN_TRACKED * len(predictions):
+                self.tracked = True
+                self.landmarks = data
+                return data
+
+        data = distance.Distance(image, a, cameraHeight, sparse).getData()
+        self.picturesSinceFullSearch = 0
+        self.landmarks = data
+        return data
+
+    def predict(self, motion, a, cameraHeight, rows, columns):
+        '''
+        Returns [x, y, post] for every landmark of the last picture which should be in the new picture (rows x columns
+        pixels), at pixel (x, y)
+        '''
+        dForwards = motion[2]
+        dSideways = motion[3]
+        dtheta = motion[4]
+        cos_t = math.cos(-dtheta)
+        sin_t = math.sin(-dtheta)
+
+        predictions = []
+        for [dist, angle, post] in self.landmarks:
+            # position relative to the robot (cm) before and after the motion
+            x = dist * math.cos(angle) - dForwards
+            y = dist * math.sin(angle) - dSideways
+            [x, y] = [cos_t * x - sin_t * y, sin_t * x + cos_t * y]
+
+            pixel = imagePosition(math.sqrt(x*x + y*y), math.atan2(y, x), a, cameraHeight, rows, columns)
+            if pixel is not None:
+                predictions.append(pixel + [post])
+        return predictions
+
+    def windows(self, predictions, rows, columns):
+        ''' [top, bottom, left, right] window around every predicted landmark, within the picture of rows x columns '''
+        half = WINDOW_SIZE / 2
+        windows = []
+        for [x, y, post] in predictions:
+            top = y - half
+            if post:
+                # the yellow of the post above its bottom, see ImageProcessing.calculateGoalposts
+                top = y - GOALPOST_WINDOW_HEIGHT
+            windows.append([max(0, top), min(rows, y + half), max(0, x - half), min(columns, x + half)])
+        return windows
+
+def imagePosition(dist, angle, a, cameraHeight, rows, columns):
+    '''
+    Pixel [x, y] where a point on the ground at distance dist (cm) and angle (rad) is seen with head angle a (degrees)
+    and camera height cameraHeight (m), in a picture of rows x columns pixels: the inverse of Distance.calculateStuff.
+    None when it is not in the picture.
+    '''
+    RESW = float(columns)
+    RESH = float(rows)
+    x = RESW/2 - (angle / (FOVHOR/2)) * (RESW/2)
+    B = a * DEG2RAD - 0.5 * FOVVER
+    yAngle = math.atan(dist * math.cos(angle) / (0.9 * 100 * cameraHeight))
+    y = RESH - ((yAngle - B) / FOVVER) * RESH
+    if dist <= 0 or math.cos(angle) <= 0 or not (0 <= x < RESW and 0 <= y < RESH):
+        return None
+    return [int(round(x)), int(round(y))]
@@ -9,6 +9,8 @@ make panel with live map and where the robot thinks it is
 from Tkinter import *
 import numpy as np
 import math
+# all actual coordinates of the cornerpoints on the field, see FieldMap
+from FieldMap import A, B, C, D, E, F, G, H, I, J, K, L, ACT_LNDMRKS
 
 #controller = MapControl()
 FIELDX = 400  # measured in cm
@@ -16,20 +18,6 @@ FIELDY = 300+150  # measured in cm (plus other half of field)
 OFFSET = 25 # don't think i'll use it
 alpha = 5  # thickness of lines
 beta = 2  # offset of circles
-# all actual coordinates of the cornerpoints on the field
-A = [0, 0]
-B = [90, 0]
-C = [90, 60]
-D = [310, 60]
-E = [310, 0]
-F = [400, 0]
-G = [400, 300]
-H = [0, 300]
-I = [200, 300]
-J = [200, 180]
-K = [130, 0]
-L = [270, 0]
-ACT_LNDMRKS = [A, B, C, D, E, F, G, H, J, K, L]
 
 # acceptable region. the minimal distance between two cornerpoints [LE for example] is 40 cm. so radius is then 20 cm
 # the detected landmark must be within this region to be accepted as a well observed landmark
@@ -97,6 +85,8 @@ class MapViewer(Frame):
                  [  1.54926942e+02  , 4.26764562e+02  , 0.00000000e+00]]]
         #print('raw output: ', output)
         #self.boolTest(0)
+        # last output drawn, SLAM returns the same object again when nothing changed
+        self.lastOutput = None
         self.mapSLAM(output)
         #self.updateMapNew(output)
         #print output
@@ -147,6 +137,10 @@ class MapViewer(Frame):
 
 
     def mapSLAM(self, output):
+        # same (read-only) output object as last time means SLAM had nothing new, no need to draw again
+        if output is self.lastOutput:
+            return
+        self.lastOutput = output
         output = self.normalizeOutputSLAM(output)
         #print('normalized: ', output)
         self.updateMapNew(output)
@@ -162,9 +156,10 @@ class MapViewer(Frame):
     def normalizeOutputSLAM(self, output): # TODO 0 1 are false true, so check for this instead of checking for booleans
         minX = float('inf')
         minY = float('inf')
-        poses = output[0]
+        # work on copies, the output of SLAM is read-only and may be shared
+        poses = [list(pose) for pose in output[0]]
         print poses
-        landmarks = output[1]
+        landmarks = [list(landmark) for landmark in output[1]]
         # check for the minX and minY
         for i in xrange(0, len(poses)):
             if poses[i][0] < minX:
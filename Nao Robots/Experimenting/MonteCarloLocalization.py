@@ -0,0 +1,195 @@
+'''
+Created on 29 Jan 2014
+
+Monte Carlo localization: a particle filter which only estimates the robot pose, on the known field map of FieldMap.
+For games we know where the landmarks are, so there is no need to run full SLAM.
+
+All particles are kept in numpy arrays (poses[i] = [x, y, theta], log_weights[i]) and every part of an update works on
+all of them at once:
+    - motion: every particle moves with its own noisy version of the odometry
+    - measurement: we don't know which landmark was measured, so the likelihood of a measurement is the sum over all
+      landmarks of the same kind (post or corner) of a gaussian on distance and relative angle, plus a small constant
+      for measurements of things which are not on the map (or not where we expect them)
+    - low variance resampling when the weights have become too uneven
+
+With 2000 particles and the 11 landmarks of the field, one step with a few measurements takes a few milliseconds.
+
+Implements the SLAM interface, so it can be used wherever EkfSLAM is used. The landmarks in its output are the fixed
+landmarks of the map.
+
+@author: Dennis
+'''
+
+import math
+import numpy
+import SLAM
+import FieldMap
+from AbstractSLAMProblem import make_random_generator
+from CommonFunctionality import normalize_angles, low_variance_resample
+
+NUM_PARTICLES = 2000
+
+# Noise defaults (standard deviations), in cm and radians. set_noise_parameters overrides them.
+RANGE_NOISE = 0.1               # per cm of measured distance
+BEARING_NOISE = 0.1
+MOTION_NOISE = 0.1              # per unit of motion
+
+# Smallest standard deviations used for motion, so particles don't collapse on a single pose
+MIN_MOTION_NOISE = [0.5, 0.5, 0.01]
+
+# Likelihood of a measurement which matches no landmark, relative to the peak of a perfect match
+OUTLIER_LIKELIHOOD = 0.001
+
+# Resample when the effective number of particles drops below this part of all particles
+RESAMPLE_THRESHOLD = 0.5
+
+class MonteCarloLocalization(SLAM.SLAM):
+
+    def __init__(self, num_particles = NUM_PARTICLES, seed = None, initial_pose = None,
+                 landmarks = FieldMap.LANDMARK_POSITIONS, landmark_is_post = FieldMap.LANDMARK_IS_POST):
+        '''
+        initial_pose = [x, y, theta] if we know where the robot starts, None spreads the particles over the whole field
+        '''
+        self.num_particles = num_particles
+        self.rng = make_random_generator(seed)
+        self.initial_pose = initial_pose
+        self.landmarks = numpy.asarray(landmarks, dtype = float)
+        self.landmark_is_post = numpy.asarray(landmark_is_post, dtype = bool)
+
+        self.range_noise = RANGE_NOISE
+        self.bearing_noise = BEARING_NOISE
+        self.motion_noise = MOTION_NOISE
+
+        self.reset()
+
+    def reset(self):
+        if self.initial_pose is None:
+            self.poses = numpy.column_stack([self.rng.uniform(0.0, FieldMap.FIELD_LENGTH, self.num_particles),
+                                             self.rng.uniform(0.0, FieldMap.FIELD_WIDTH, self.num_particles),
+                                             self.rng.uniform(-math.pi, math.pi, self.num_particles)])
+        else:
+            self.poses = numpy.tile(numpy.array(self.initial_pose, dtype = float), (self.num_particles, 1))
+        self.log_weights = numpy.zeros(self.num_particles)
+
+        self.measurement_data = []
+        self.motion_data = []
+
+        self.offline = False
+        self.output = []
+
+        self.data_changed()
+
+    def send_data(self, measurement_data, motion_data):
+        self.measurement_data.append(measurement_data)
+        self.motion_data.append(motion_data)
+        self.data_changed()
+
+    def set_noise_parameters(self, measurement_noise_range, measurement_noise_bearing, motion_noise):
+        ''' Standard deviations: range noise per cm of distance, bearing noise in radians, motion noise per unit of motion '''
+        self.range_noise = measurement_noise_range
+        self.bearing_noise = measurement_noise_bearing
+        self.motion_noise = motion_noise
+        self.data_changed()
+
+    def set_offline(self):
+        self.offline = True
+
+        self.output = [[], []]
+        self.data_changed()
+
+    def set_parameter(self, parameter_name, value):
+        raise NotImplementedError("The set_paramter method of this SLAM algorithm has not yet been implemented!")
+
+    def run_slam(self):
+        '''
+        Runs the particle filter on the data received since the last run. Same input and output format as EkfSLAM:
+        online [[rob_pos, landmark_pos]] for the last step, offline [[rob_pos per step], [landmark_pos per step]].
+        rob_pos is the weighted mean of the particles, landmark_pos the landmarks of the map.
+
+        Returns the same read-only output object as last time if no data came in since then (see SLAM.get_data_version)
+        '''
+        if(self.result_is_current()):
+            return self.result
+
+        if(len(self.motion_data) != len(self.measurement_data)):
+            print "Size of measurement data does not equal size of motion data, should send empty array when no landmarks were observed"
+            return
+
+        landmark_pos = [[x, y, post] for ((x, y), post) in zip(self.landmarks.tolist(), self.landmark_is_post.tolist())]
+        for step in xrange(len(self.motion_data)):
+            self.move(self.motion_data[step])
+            self.measure(self.measurement_data[step])
+            self.resample()
+
+            if(self.offline):
+                self.output[0].append(self.estimate())
+                self.output[1].append(landmark_pos)
+
+        if(not self.offline):
+            self.output = [[self.estimate(), landmark_pos]]
+
+        self.measurement_data = []
+        self.motion_data = []
+
+        return self.store_result(self.output)
+
+    def move(self, motion_data_step):
+        '''
+        Moves all particles with motion [time,action,dForwards,dSideways,dtheta,speed], each with its own noise.
+        Uses the motion model of EkfSLAM: move with the old orientation, then turn.
+        '''
+        motion = numpy.array([motion_data_step[2], motion_data_step[3], motion_data_step[4]], dtype = float)
+        deviation = numpy.abs(motion) * self.motion_noise + MIN_MOTION_NOISE
+        noisy = motion + deviation * self.rng.normal(0.0, 1.0, (self.num_particles, 3))
+
+        cos_theta = numpy.cos(self.poses[:, 2])
+        sin_theta = numpy.sin(self.poses[:, 2])
+        self.poses[:, 0] += noisy[:, 0] * cos_theta + noisy[:, 1] * sin_theta
+        self.poses[:, 1] += noisy[:, 0] * sin_theta + noisy[:, 1] * cos_theta
+        self.poses[:, 2] = normalize_angles(self.poses[:, 2] + noisy[:, 2])
+
+    def measure(self, measurement_data_step):
+        ''' Weighs all particles by the likelihood of all measurements [distance, relative angle, post] of one step '''
+        for (distance, bearing, post) in measurement_data_step:
+            landmarks = self.landmarks[self.landmark_is_post == bool(post)]
+            if len(landmarks) == 0:
+                continue
+
+            # (particle, landmark) arrays of expected distance and relative angle
+            dx = landmarks[:, 0] - self.poses[:, 0:1]
+            dy = landmarks[:, 1] - self.poses[:, 1:2]
+            expected_distance = numpy.sqrt(dx*dx + dy*dy)
+            expected_bearing = numpy.arctan2(dy, dx) - self.poses[:, 2:3]
+
+            range_deviation = max(distance * self.range_noise, 1.0)
+            distance_error = (distance - expected_distance) / range_deviation
+            bearing_error = normalize_angles(bearing - expected_bearing) / self.bearing_noise
+            likelihood = numpy.exp(-0.5 * (distance_error * distance_error + bearing_error * bearing_error)).sum(1)
+            self.log_weights += numpy.log(likelihood + OUTLIER_LIKELIHOOD)
+
+        # keep the numbers in range, only differences between particles matter
+        self.log_weights -= self.log_weights.max()
+
+    def weights(self):
+        weights = numpy.exp(self.log_weights)
+        return weights / weights.sum()
+
+    def resample(self):
+        ''' Low variance resampling, when the weights have become too uneven '''
+        weights = self.weights()
+        effective = 1.0 / (weights * weights).sum()
+        if(effective >= RESAMPLE_THRESHOLD * self.num_particles):
+            return
+
+        chosen = low_variance_resample(weights, self.rng)
+
+        self.poses = self.poses[chosen]
+        self.log_weights = numpy.zeros(self.num_particles)
+
+    def estimate(self):
+        ''' Weighted mean pose of the particles [x, y, theta], with the mean of theta taken on the circle '''
+        weights = self.weights()
+        x = numpy.dot(weights, self.poses[:, 0])
+        y = numpy.dot(weights, self.poses[:, 1])
+        theta = math.atan2(numpy.dot(weights, numpy.sin(self.poses[:, 2])), numpy.dot(weights, numpy.cos(self.poses[:, 2])))
+        return [float(x), float(y), theta]
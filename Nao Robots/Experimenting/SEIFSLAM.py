@@ -0,0 +1,339 @@
+'''
+Created on 27 Jan 2014
+
+Sparse extended information filter (SEIF) SLAM, after chapter 12 of Probabilistic Robotics.
+
+Where EkfSLAM keeps a mean and a dense covariance matrix, this keeps the information matrix (the inverse of the
+covariance) Omega, the information vector xi = Omega * mu and an estimate of the mean mu. In information form a
+measurement only adds to the blocks of the robot pose and the measured landmark, and a motion only touches the pose
+and the landmarks linked to it. Sparsification keeps the number of landmarks linked to the pose (the active
+landmarks) at most MAX_ACTIVE_LANDMARKS, so both cost a bounded amount of time however big the map gets.
+
+Omega is stored as blocks: node 0 is the robot pose (3 numbers), node k + 1 is landmark k (2 numbers) and
+omega[i][j] is the block between nodes i and j, only for linked nodes. Mean recovery is incremental: after every step
+a few coordinate descent (Gauss-Seidel) updates solve Omega * mu = xi for the pose, the active landmarks and a few
+other landmarks in turn, instead of inverting Omega.
+
+@author: Dennis
+'''
+
+import math
+import numpy
+import SLAM
+from CommonFunctionality import LandmarkIndex, normalize_angles
+
+# The square root of the constant below is the minimum distance that needs to separate
+# 2 landmarks for the algorithm to treat them as being different landmarks (same as in EkfSLAM)
+ASSOCIATE_LANDMARK_THRESHOLD = 900
+
+# At most this many landmarks stay linked to the robot pose after every step (landmarks measured in the
+# step itself are never deactivated, so there can be more if a single step measures more)
+MAX_ACTIVE_LANDMARKS = 8
+
+# Number of coordinate descent sweeps over the pose and the active landmarks after every step, and number of
+# other landmarks which get one update every step (taking turns), so corrections spread through the whole map
+RECOVERY_SWEEPS = 2
+RECOVERY_LANDMARKS_PER_STEP = 4
+
+# Information about the starting pose. It is known, like in EkfSLAM where it starts with zero covariance.
+PRIOR_INFORMATION = 1000000.0
+
+# Smallest noise used, so zero noise settings don't give singular matrices
+MIN_NOISE = 0.000001
+
+POSE = 0
+
+class SEIFSLAM(SLAM.SLAM):
+
+    def __init__(self, association_threshold = ASSOCIATE_LANDMARK_THRESHOLD, max_active = MAX_ACTIVE_LANDMARKS):
+        self.association_threshold = association_threshold
+        self.max_active = max_active
+
+        self.measurement_noise_range = MIN_NOISE
+        self.measurement_noise_bearing = MIN_NOISE
+        self.motion_noise = MIN_NOISE
+
+        self.reset()
+
+    def reset(self):
+        # node 0 is the pose, it starts at the origin and is known
+        self.omega = [{POSE : numpy.eye(3) * PRIOR_INFORMATION}]
+        self.xi = [numpy.zeros(3)]
+        self.mu = [numpy.zeros(3)]
+
+        # active landmark nodes, least recently measured first
+        self.active = []
+        # next landmark node to get a mean update outside the active ones
+        self.next_recovery = 1
+
+        self.landmark_index = LandmarkIndex(self.association_threshold)
+        self.goal_posts = []
+
+        self.measurement_data = []
+        self.motion_data = []
+
+        self.offline = False
+        self.output = []
+
+        self.data_changed()
+
+    def send_data(self, measurement_data, motion_data):
+        self.measurement_data.append(measurement_data)
+        self.motion_data.append(motion_data)
+        self.data_changed()
+
+    def set_noise_parameters(self, measurement_noise_range, measurement_noise_bearing, motion_noise):
+        ''' Same meaning as in EkfSLAM: range noise is per unit of distance, motion noise per unit of movement '''
+        self.measurement_noise_range = max(measurement_noise_range, MIN_NOISE)
+        self.measurement_noise_bearing = max(measurement_noise_bearing, MIN_NOISE)
+        self.motion_noise = max(motion_noise, MIN_NOISE)
+        self.data_changed()
+
+    def set_offline(self):
+        self.offline = True
+
+        self.output = [[], []]
+        self.data_changed()
+
+    def set_parameter(self, parameter_name, value):
+        raise NotImplementedError("The set_paramter method of this SLAM algorithm has not yet been implemented!")
+
+    def run_slam(self):
+        '''
+        Runs the filter on the data received since the last run. Same input and output format as EkfSLAM: online
+        [[rob_pos, landmark_pos]] for the last step, offline [[rob_pos per step], [landmark_pos per step]].
+
+        Returns the same read-only output object as last time if no data came in since then (see SLAM.get_data_version)
+        '''
+        if(self.result_is_current()):
+            return self.result
+
+        if(len(self.motion_data) != len(self.measurement_data)):
+            print "Size of measurement data does not equal size of motion data, should send empty array when no landmarks were observed"
+            return
+
+        for step in xrange(len(self.motion_data)):
+            self.move(self.motion_data[step])
+            measured = []
+            for measurement in self.measurement_data[step]:
+                measured.append(self.measure(measurement))
+            self.sparsify(measured)
+            self.recover_means()
+
+            if(self.offline):
+                self.output[0].append(self.robot_position())
+                self.output[1].append(self.landmark_positions())
+
+        if(not self.offline):
+            self.output = [[self.robot_position(), self.landmark_positions()]]
+
+        # only remembering the information form is enough, like in EKF SLAM
+        self.measurement_data = []
+        self.motion_data = []
+
+        return self.store_result(self.output)
+
+    def robot_position(self):
+        return [self.mu[POSE][0], self.mu[POSE][1], normalize_angles(self.mu[POSE][2])]
+
+    def landmark_positions(self):
+        return [[self.mu[k + 1][0], self.mu[k + 1][1], self.goal_posts[k]] for k in xrange(len(self.goal_posts))]
+
+    '''
+    Blocks of the information matrix
+    '''
+
+    def block(self, i, j):
+        return self.omega[i].get(j)
+
+    def add_block(self, i, j, matrix):
+        ''' Adds matrix to block (i, j), and its transpose to block (j, i) '''
+        row = self.omega[i]
+        if j in row:
+            row[j] = row[j] + matrix
+        else:
+            row[j] = matrix
+        if i != j:
+            row = self.omega[j]
+            if i in row:
+                row[i] = row[i] + matrix.T
+            else:
+                row[i] = matrix.T.copy()
+
+    def remove_link(self, i, j):
+        self.omega[i].pop(j, None)
+        self.omega[j].pop(i, None)
+
+    def move(self, motion_data_step):
+        '''
+        Motion update with [time,action,dForwards,dSideways,dtheta,speed], motion model of EkfSLAM (move with the
+        old orientation, then turn). Adds the new pose, then marginalizes out the old one. The old pose is only linked
+        to the active landmarks, so this costs O(active^2) and links the active landmarks to each other.
+        '''
+        dForwards = motion_data_step[2]
+        dSideways = motion_data_step[3]
+        dtheta = normalize_angles(motion_data_step[4])
+
+        theta = self.mu[POSE][2]
+        sin_theta = math.sin(theta)
+        cos_theta = math.cos(theta)
+        dx = dForwards * cos_theta + dSideways * sin_theta
+        dy = dForwards * sin_theta + dSideways * cos_theta
+
+        # new pose = G * old pose + b (linearized around the current mean)
+        G = numpy.eye(3)
+        G[0, 2] = -dForwards * sin_theta + dSideways * cos_theta
+        G[1, 2] = dForwards * cos_theta - dSideways * sin_theta
+        new_pose = self.mu[POSE] + [dx, dy, dtheta]
+        b = new_pose - numpy.dot(G, self.mu[POSE])
+
+        # motion noise grows with the motion, like Q in EkfSLAM
+        c = self.motion_noise
+        Q_inv = numpy.diag(1.0 / (c * numpy.array([dx*dx, dy*dy, dtheta*dtheta]) + MIN_NOISE))
+        Q_inv_G = numpy.dot(Q_inv, G)
+
+        # information of the old pose, including the new motion factor, and its inverse
+        old_pose_info = self.omega[POSE][POSE] + numpy.dot(G.T, Q_inv_G)
+        old_pose_xi = self.xi[POSE] - numpy.dot(Q_inv_G.T, b)
+        M = numpy.linalg.inv(old_pose_info)
+
+        # links of the old pose with the new pose (-G^T Q^-1) and with the active landmarks
+        links = dict((k, self.omega[POSE][k]) for k in self.active)
+        links_M = dict((k, numpy.dot(links[k].T, M)) for k in self.active)     # Omega[k, old] * M
+
+        # Schur complement over the new pose and the active landmarks
+        Q_inv_G_M = numpy.dot(Q_inv_G, M)
+        self.omega[POSE] = {POSE : Q_inv - numpy.dot(Q_inv_G_M, Q_inv_G.T)}
+        self.xi[POSE] = numpy.dot(Q_inv, b) + numpy.dot(Q_inv_G_M, old_pose_xi)
+        for k in self.active:
+            self.omega[k].pop(POSE, None)
+            # link of the new pose to k: -(-Q^-1 G) M Omega[old, k]
+            self.add_block(POSE, k, numpy.dot(Q_inv_G_M, links[k]))
+            self.xi[k] = self.xi[k] - numpy.dot(links_M[k], old_pose_xi)
+            for l in self.active:
+                if l >= k:
+                    self.add_block(k, l, -numpy.dot(links_M[k], links[l]))
+        self.mu[POSE] = new_pose
+
+    def measure(self, measurement):
+        '''
+        Measurement update with [distance, relative angle, post]. Adds a new landmark when it does not associate
+        with a known one. Only changes the blocks of the pose and that landmark. Returns the landmark node.
+        '''
+        r = measurement[0]
+        bearing = measurement[1]
+        post = measurement[2]
+
+        pose = self.mu[POSE]
+        x = pose[0] + r * math.cos(pose[2] + bearing)
+        y = pose[1] + r * math.sin(pose[2] + bearing)
+        landmark = self.landmark_index.nearest(x, y, post)
+        if(landmark == -1):
+            landmark = len(self.goal_posts)
+            self.landmark_index.insert(x, y, post, landmark)
+            self.goal_posts.append(post)
+            self.omega.append({})
+            self.xi.append(numpy.zeros(2))
+            self.mu.append(numpy.array([x, y]))
+        node = landmark + 1
+
+        # linearize the measurement model around the current means
+        dx = self.mu[node][0] - pose[0]
+        dy = self.mu[node][1] - pose[1]
+        q = max(dx*dx + dy*dy, MIN_NOISE)
+        predicted_r = math.sqrt(q)
+        H_pose = numpy.array([[-dx / predicted_r, -dy / predicted_r, 0.0], [dy / q, -dx / q, -1.0]])
+        H_landmark = numpy.array([[dx / predicted_r, dy / predicted_r], [-dy / q, dx / q]])
+        innovation = numpy.array([r - predicted_r, normalize_angles(bearing - (math.atan2(dy, dx) - pose[2]))])
+
+        R_inv = numpy.diag([1.0 / max(r * self.measurement_noise_range, MIN_NOISE), 1.0 / self.measurement_noise_bearing])
+        target = innovation + numpy.dot(H_pose, pose) + numpy.dot(H_landmark, self.mu[node])
+        Ht_R_inv_pose = numpy.dot(H_pose.T, R_inv)
+        Ht_R_inv_landmark = numpy.dot(H_landmark.T, R_inv)
+
+        self.add_block(POSE, POSE, numpy.dot(Ht_R_inv_pose, H_pose))
+        self.add_block(POSE, node, numpy.dot(Ht_R_inv_pose, H_landmark))
+        self.add_block(node, node, numpy.dot(Ht_R_inv_landmark, H_landmark))
+        self.xi[POSE] = self.xi[POSE] + numpy.dot(Ht_R_inv_pose, target)
+        self.xi[node] = self.xi[node] + numpy.dot(Ht_R_inv_landmark, target)
+
+        # most recently measured landmarks go to the end of the active list
+        if node in self.active:
+            self.active.remove(node)
+        self.active.append(node)
+        return node
+
+    def sparsify(self, measured):
+        '''
+        Deactivates the least recently measured landmarks until at most max_active are left (never one measured
+        this step): removes their links with the pose and approximates what those links meant (SEIF sparsification,
+        table 12.5 of Probabilistic Robotics). Works on the pose and the active landmarks only, so O(max_active^3).
+        '''
+        deactivate = [k for k in self.active if k not in measured][:max(len(self.active) - self.max_active, 0)]
+        if len(deactivate) == 0:
+            return
+        keep = [k for k in self.active if k not in deactivate]
+
+        # dense Omega over x (pose), m+ (kept) and m0 (deactivated), conditioned on all other landmarks
+        nodes = [POSE] + keep + deactivate
+        sizes = [len(self.mu[n]) for n in nodes]
+        offsets = numpy.concatenate([[0], numpy.cumsum(sizes)])
+        Omega0 = numpy.zeros((offsets[-1], offsets[-1]))
+        for a in xrange(len(nodes)):
+            for b in xrange(len(nodes)):
+                matrix = self.block(nodes[a], nodes[b])
+                if matrix is not None:
+                    Omega0[offsets[a]:offsets[a + 1], offsets[b]:offsets[b + 1]] = matrix
+
+        pose_part = numpy.arange(3)
+        m0_part = numpy.arange(offsets[1 + len(keep)], offsets[-1])
+        x_m0_part = numpy.concatenate([pose_part, m0_part])
+
+        # Omega~ - Omega = -Omega1 + Omega2 - Omega3. Omega3 needs the whole pose column of Omega, but the pose is only
+        # linked to active landmarks, so Omega0 has all of it.
+        change = -marginal_term(Omega0, m0_part) + marginal_term(Omega0, x_m0_part) - marginal_term(Omega0, pose_part)
+        mu = numpy.concatenate([self.mu[n] for n in nodes])
+        xi_change = numpy.dot(change, mu)
+
+        for a in xrange(len(nodes)):
+            self.xi[nodes[a]] = self.xi[nodes[a]] + xi_change[offsets[a]:offsets[a + 1]]
+            for b in xrange(a, len(nodes)):
+                part = change[offsets[a]:offsets[a + 1], offsets[b]:offsets[b + 1]]
+                if numpy.any(part != 0):
+                    self.add_block(nodes[a], nodes[b], part)
+        for k in deactivate:
+            self.remove_link(POSE, k)
+        self.active = keep
+
+    def recover_means(self):
+        '''
+        A few coordinate descent updates of mu for Omega * mu = xi: sweeps over the pose and the active landmarks
+        (which changed this step), and an update of the next few landmarks in turn.
+        '''
+        for sweep in xrange(RECOVERY_SWEEPS):
+            self.update_mean(POSE)
+            for node in self.active:
+                self.update_mean(node)
+
+        num_landmarks = len(self.goal_posts)
+        for i in xrange(min(RECOVERY_LANDMARKS_PER_STEP, num_landmarks)):
+            if self.next_recovery > num_landmarks:
+                self.next_recovery = 1
+            self.update_mean(self.next_recovery)
+            self.next_recovery += 1
+
+    def update_mean(self, node):
+        ''' mu[node] = Omega[node, node]^-1 * (xi[node] - sum of Omega[node, j] * mu[j] over the linked nodes j) '''
+        row = self.omega[node]
+        if node not in row:
+            return
+        rest = self.xi[node].copy()
+        for (j, matrix) in row.iteritems():
+            if j != node:
+                rest -= numpy.dot(matrix, self.mu[j])
+        self.mu[node] = numpy.linalg.solve(row[node], rest)
+
+def marginal_term(Omega, part):
+    ''' Omega F (F^T Omega F)^-1 F^T Omega, where F selects the rows and columns in part '''
+    columns = Omega[:, part]
+    return numpy.dot(columns, numpy.linalg.solve(Omega[numpy.ix_(part, part)], columns.T))
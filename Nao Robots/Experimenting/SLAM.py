@@ -13,6 +13,88 @@ algorithm whenever we like, reset it, etc.
 
 '''
 
+import numpy
+
+def freeze_output(output):
+    '''
+    Makes a read-only version of a run_slam OUTPUT, so one result object can be handed to everybody who asks for it
+    (every call of run_slam without new data returns the same object) without anyone changing it for the others.
+    Lists become FrozenList views and numpy arrays are marked read-only. Nothing is copied, so this costs the same for
+    a run of ten steps as for a run of ten thousand. Anyone who wants to change the output should make a copy first
+    (FrozenList.tolist).
+    '''
+    if isinstance(output, numpy.ndarray):
+        if output.dtype == object:
+            for item in output.flat:
+                freeze_output(item)
+        output.setflags(write = False)
+        return output
+    if isinstance(output, FrozenList):
+        return output
+    if isinstance(output, list):
+        return FrozenList(output, remember_item_lengths = True)
+    if isinstance(output, tuple):
+        return tuple(freeze_output(item) for item in output)
+    return output
+
+class FrozenList(object):
+    '''
+    Read-only view of the items a list has when the view is made. Indexing, slicing, len, iteration, comparing and
+    numpy.array work like on a list, and items which are lists come out as FrozenLists too. There is no append or
+    item assignment.
+    
+    Offline SLAM keeps appending a pose and landmarks to the lists in its output, so freeze_output also remembers
+    how long the lists directly in OUTPUT were. Those lists may keep growing afterwards, the view stays the same.
+    Anything deeper must not change anymore once it has been handed out.
+    '''
+    __slots__ = ("items", "length", "item_lengths")
+    
+    def __init__(self, items, length = None, remember_item_lengths = False):
+        self.items = items
+        self.length = len(items) if length is None else length
+        self.item_lengths = None
+        if remember_item_lengths:
+            self.item_lengths = [len(item) if isinstance(item, list) else None for item in items[:self.length]]
+    
+    def __len__(self):
+        return self.length
+    
+    def item(self, index):
+        item = self.items[index]
+        if isinstance(item, list):
+            return FrozenList(item, None if self.item_lengths is None else self.item_lengths[index])
+        return freeze_output(item)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return FrozenList([self.item(i) for i in xrange(*index.indices(self.length))])
+        if index < 0:
+            index += self.length
+        if index < 0 or index >= self.length:
+            raise IndexError("FrozenList index out of range")
+        return self.item(index)
+    
+    def __iter__(self):
+        for index in xrange(self.length):
+            yield self.item(index)
+    
+    def __eq__(self, other):
+        if not isinstance(other, (list, tuple, FrozenList)) or len(other) != self.length:
+            return False
+        return all(mine == theirs for (mine, theirs) in zip(self, other))
+    
+    def __ne__(self, other):
+        return not self == other
+    
+    __hash__ = None
+    
+    def tolist(self):
+        ''' A changeable copy: plain lists all the way down '''
+        return [item.tolist() if isinstance(item, FrozenList) else item for item in self]
+    
+    def __repr__(self):
+        return repr(self.tolist())
+
 class SLAM:
     
     '''
@@ -40,7 +122,8 @@ class SLAM:
     and memorizing all data forever, and re-run the algorithm from scratch on all data so far, whereas EKF SLAM can discard all
     old data once this method runs and on the next call to this method use the previous results as starting point.
     
-    run_slam returns a single object OUTPUT, in the following format:
+    run_slam returns a single read-only object OUTPUT (see freeze_output: lists in it are FrozenList views, which
+    can be read like lists but not changed, use tolist() for a copy that can), in the following format:
     
     OUTPUT = [rob_pos, landmark_pos]
 
@@ -53,6 +136,46 @@ class SLAM:
     def run_slam(self):
         raise NotImplementedError("The run_slam method of this SLAM algorithm has not yet been implemented!")
     
+    # data_version goes up whenever something happens that can change the output of run_slam. result is the
+    # (read-only) output of the last run, which is still valid as long as result_version equals data_version.
+    # Class attributes, so every SLAM algorithm starts at version 0 without any work in its constructor.
+    data_version = 0
+    result = None
+    result_version = None
+    
+    '''
+    Returns a number which changes every time something happens which can change the result of
+    run_slam (new data, reset, changed settings), and stays the same otherwise.
+    
+    run_slam returns the very same (read-only, see freeze_output) OUTPUT object as long as this number is the same,
+    without running the algorithm again. So callers can see that nothing changed by comparing versions, or simply by
+    checking if the OUTPUT they got is the OUTPUT they got last time.
+    '''
+    def get_data_version(self):
+        return self.data_version
+    
+    '''
+    SLAM algorithms call this from reset, send_data, set_noise_parameters, set_offline and anything else
+    which can change the result of run_slam. The result of the last run is no longer current after this.
+    '''
+    def data_changed(self):
+        self.data_version += 1
+    
+    '''
+    True if the result of the last run_slam is still valid, so run_slam can return self.result right away.
+    '''
+    def result_is_current(self):
+        return self.result_version == self.data_version
+    
+    '''
+    Remembers OUTPUT as the result for the current data version and returns the read-only version of it,
+    for run_slam to return.
+    '''
+    def store_result(self, output):
+        self.result = freeze_output(output)
+        self.result_version = self.data_version
+        return self.result
+    
     '''
     This method sends an 2D array of measurement-data of a specified time_step to the SLAM algorithm.
     The implementation of the SLAM algorithm will most likely want to append the new data to an internal 
@@ -0,0 +1,290 @@
+'''
+Created on 21 Jan 2014
+
+Benchmarks for the SLAM backends, on synthetic worlds from AbstractSLAMProblem of increasing size.
+
+For every backend and size we measure
+    - wall time of every run_slam call (online: send_data and run_slam after every step, like ControlFlow does)
+    - peak memory of the process (every case runs in a fresh process, so this is the peak of that case alone)
+    - allocations per step: python objects tracked by the garbage collector which are created and not freed again
+      during the step. Python 2 has no tracemalloc, so this net count is the best we can do. It shows state which
+      keeps growing (like matrices which get bigger every step) and temporary objects which leak.
+    - accuracy of the result: trajectory and landmark errors from TrajectoryMetrics, so a speed up which breaks
+      the estimate shows up as a regression too
+
+GRAPH is the plain GraphSLAM solver run once on the whole log (the way slam_experiment uses it), GRAPH_INHERITED,
+EKF, FAST (FastSLAM) and SEIF are the SLAM.SLAM implementations run online.
+
+Results go to a json file. Compare them with a saved baseline to catch performance regressions:
+
+    python SLAMBenchmark.py                    runs the benchmark, writes RESULTS_FILE, compares with BASELINE_FILE
+    python SLAMBenchmark.py --save-baseline    runs the benchmark and saves the results as the new baseline
+
+@author: Dennis
+'''
+
+import gc
+import json
+import multiprocessing
+import os
+import sys
+import time
+import numpy
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from AbstractSLAMProblem import AbstractSLAMProblem
+from CommonFunctionality import CommonFunctionality
+from EkfSLAM import EkfSLAM
+from FastSLAM import FastSLAM
+from SEIFSLAM import SEIFSLAM
+from GraphSLAM import GraphSLAM
+from GraphSLAMInherited import GraphSLAMInherited
+import TrajectoryMetrics
+
+BACKENDS = ["EKF", "GRAPH_INHERITED", "GRAPH", "FAST", "SEIF"]
+
+# (num_steps, num_landmarks) of the scenarios, from small to big
+SIZES = [(25, 4), (50, 8), (100, 16), (200, 32)]
+
+WORLD_SIZE = 75.0
+MEASUREMENT_RANGE = 30.0
+MOTION_NOISE = 0.01
+MEASUREMENT_NOISE = 0.01
+DISTANCE = 2.0
+SEED = 1
+
+RESULTS_FILE = "benchmark_results.json"
+BASELINE_FILE = "benchmark_baseline.json"
+
+# A case regresses when a metric gets this much worse than in the baseline
+TOLERANCE = 1.25
+
+# Metrics compared with the baseline (more is worse for all of them)
+COMPARED_METRICS = ["total_slam_time", "max_slam_time", "peak_memory_kb", "allocations_per_step", "ate_rmse", "landmark_rmse"]
+
+# A true landmark counts as found when an estimated landmark is at most this far away (after alignment)
+LANDMARK_MATCH_DISTANCE = 5.0
+
+# Timings below these values are mostly noise, they don't count as regressions
+MINIMUM_COMPARED = {"total_slam_time" : 0.05, "max_slam_time" : 0.05}
+
+def peak_memory_kb():
+    ''' Peak resident memory of this process so far in kB, or None if the platform can't tell '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # bytes on mac, kB everywhere else
+        peak = peak / 1024
+    return peak
+
+class AllocationCounter:
+    '''
+    Counts objects the garbage collector starts tracking and does not stop tracking again between start() and stop().
+    Garbage collection is switched off in between, so the counter is not reset by a collection.
+    '''
+
+    def start(self):
+        self.was_enabled = gc.isenabled()
+        gc.collect()
+        gc.disable()
+        self.count = gc.get_count()[0]
+
+    def stop(self):
+        allocations = gc.get_count()[0] - self.count
+        if self.was_enabled:
+            gc.enable()
+        return allocations
+
+def make_scenario(num_steps, num_landmarks):
+    ''' Returns [true_positions, landmarks, motions, measurements] of a seeded synthetic world '''
+    problem = AbstractSLAMProblem(WORLD_SIZE, MEASUREMENT_RANGE, MOTION_NOISE, MEASUREMENT_NOISE, num_landmarks, seed = SEED)
+    return problem.run_simulation_vectorized(num_steps, num_landmarks, MEASUREMENT_RANGE,
+                                             MOTION_NOISE, MEASUREMENT_NOISE, DISTANCE)
+
+def run_online(slam, motions, measurements):
+    '''
+    Sends data and runs slam after every step.
+    Returns [list of run_slam times, list of estimated poses, final estimated landmarks]
+    '''
+    times = []
+    poses = []
+    for step in xrange(len(motions)):
+        slam.send_data(measurements[step], motions[step])
+        start = time.time()
+        output = slam.run_slam()
+        times.append(time.time() - start)
+        # online output of all backends starts with the current pose
+        poses.append(list(output[0][0]))
+    if isinstance(slam, GraphSLAMInherited):
+        landmarks = output[1]
+    else:
+        landmarks = output[0][1]
+    return [times, poses, landmarks]
+
+def run_graph(motions, measurements):
+    '''
+    Preprocesses the whole log and solves it once with GraphSLAM.
+    Returns [list with that one time, estimated poses, estimated landmarks]
+    '''
+    slam = GraphSLAM()
+    start = time.time()
+    engine = CommonFunctionality()
+    data = engine.make_data(motions, measurements)
+    [mu, booleans] = slam.graphSlam(data, len(data) + 1, len(engine.landmarks), 2.0, 2.0)
+    times = [time.time() - start]
+
+    # mu has x, y of the start and every step, then x, y of every landmark. Orientation comes from the preprocessing.
+    mu = numpy.asarray(mu).ravel()
+    positions = mu[2:2 * (len(data) + 1)].reshape(-1, 2)
+    orientations = numpy.array([data[k][1][0][2] for k in xrange(len(data))])
+    poses = numpy.column_stack([positions, orientations])
+    landmarks = mu[2 * (len(data) + 1):].reshape(-1, 2)
+    return [times, poses, landmarks]
+
+def run_case(case):
+    '''
+    Runs one (backend, num_steps, num_landmarks) case and returns its metrics as a dict.
+    Module level function, runs in its own process (see run_benchmark).
+    '''
+    (backend, num_steps, num_landmarks) = case
+    [true_positions, true_landmarks, motions, measurements] = make_scenario(num_steps, num_landmarks)
+
+    counter = AllocationCounter()
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    counter.start()
+    try:
+        if backend == "EKF":
+            slam = EkfSLAM()
+            slam.set_noise_parameters(MEASUREMENT_NOISE, MEASUREMENT_NOISE, MOTION_NOISE)
+            [times, poses, landmarks] = run_online(slam, motions, measurements)
+        elif backend == "GRAPH_INHERITED":
+            [times, poses, landmarks] = run_online(GraphSLAMInherited(), motions, measurements)
+        elif backend == "GRAPH":
+            [times, poses, landmarks] = run_graph(motions, measurements)
+        elif backend == "FAST":
+            slam = FastSLAM(seed = SEED)
+            slam.set_noise_parameters(MEASUREMENT_NOISE, MEASUREMENT_NOISE, MOTION_NOISE)
+            [times, poses, landmarks] = run_online(slam, motions, measurements)
+        elif backend == "SEIF":
+            slam = SEIFSLAM()
+            slam.set_noise_parameters(MEASUREMENT_NOISE, MEASUREMENT_NOISE, MOTION_NOISE)
+            [times, poses, landmarks] = run_online(slam, motions, measurements)
+        else:
+            raise ValueError("Unknown backend " + str(backend) + ", should be one of " + str(BACKENDS))
+    finally:
+        allocations = counter.stop()
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    result = {
+        "backend" : backend,
+        "num_steps" : num_steps,
+        "num_landmarks" : num_landmarks,
+        "run_slam_calls" : len(times),
+        "total_slam_time" : sum(times),
+        "mean_slam_time" : sum(times) / len(times),
+        "max_slam_time" : max(times),
+        "peak_memory_kb" : peak_memory_kb(),
+        "allocations_per_step" : float(allocations) / num_steps,
+    }
+    result.update(TrajectoryMetrics.evaluate(poses, true_positions, landmarks, true_landmarks[:num_landmarks],
+                                             max_distance = LANDMARK_MATCH_DISTANCE))
+    return result
+
+def run_benchmark(backends = BACKENDS, sizes = SIZES):
+    '''
+    Runs every backend on every size, each case in a fresh process (so peak memory is per case),
+    one case at a time (so cases don't slow each other down). Returns list of result dicts.
+    '''
+    cases = [(backend, num_steps, num_landmarks) for backend in backends for (num_steps, num_landmarks) in sizes]
+    pool = multiprocessing.Pool(1, maxtasksperchild = 1)
+    try:
+        results = []
+        for result in pool.imap(run_case, cases):
+            print "%-16s steps = %5d, landmarks = %4d: total %.3f s, max %.4f s per run_slam, peak %s kB, %.1f allocations per step, ATE %.3f" % (
+                result["backend"], result["num_steps"], result["num_landmarks"], result["total_slam_time"],
+                result["max_slam_time"], result["peak_memory_kb"], result["allocations_per_step"], result["ate_rmse"])
+            results.append(result)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+def scaling_exponents(results):
+    '''
+    For every backend fits total_slam_time ~ num_steps^k over the sizes and returns {backend : k}.
+    k = 1 means linear in the length of the run, 2 quadratic and so on.
+    '''
+    exponents = {}
+    for backend in sorted(set(result["backend"] for result in results)):
+        rows = [result for result in results if result["backend"] == backend and result["total_slam_time"] > 0]
+        if len(rows) < 2:
+            continue
+        steps = numpy.log([row["num_steps"] for row in rows])
+        times = numpy.log([row["total_slam_time"] for row in rows])
+        exponents[backend] = float(numpy.polyfit(steps, times, 1)[0])
+    return exponents
+
+def save_results(results, filename):
+    with open(filename, "w") as output:
+        json.dump({"results" : results, "scaling_exponents" : scaling_exponents(results)}, output, indent = 1, sort_keys = True)
+
+def load_results(filename):
+    with open(filename) as saved:
+        return json.load(saved)["results"]
+
+def compare_with_baseline(results, baseline, tolerance = TOLERANCE):
+    '''
+    Returns a list of regressions: [backend, num_steps, num_landmarks, metric, baseline value, new value] for every
+    metric in COMPARED_METRICS which got worse than tolerance times its baseline value.
+    Cases which are not in the baseline and timings below MINIMUM_COMPARED are skipped.
+    '''
+    baseline_cases = {}
+    for result in baseline:
+        baseline_cases[(result["backend"], result["num_steps"], result["num_landmarks"])] = result
+
+    regressions = []
+    for result in results:
+        old = baseline_cases.get((result["backend"], result["num_steps"], result["num_landmarks"]))
+        if old is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if old.get(metric) is None or result.get(metric) is None:
+                continue
+            if result[metric] < MINIMUM_COMPARED.get(metric, 0.0):
+                continue
+            if result[metric] > tolerance * old[metric] and result[metric] > 0:
+                regressions.append([result["backend"], result["num_steps"], result["num_landmarks"], metric, old[metric], result[metric]])
+    return regressions
+
+if __name__ == "__main__":
+    results = run_benchmark()
+
+    print ""
+    for (backend, exponent) in sorted(scaling_exponents(results).items()):
+        print "%-16s total time grows like num_steps^%.2f" % (backend, exponent)
+
+    if "--save-baseline" in sys.argv:
+        save_results(results, BASELINE_FILE)
+        print "Saved baseline to " + BASELINE_FILE
+        sys.exit(0)
+
+    save_results(results, RESULTS_FILE)
+    print "Saved results to " + RESULTS_FILE
+
+    if not os.path.exists(BASELINE_FILE):
+        print "No baseline in " + BASELINE_FILE + ", run with --save-baseline to make one"
+        sys.exit(0)
+
+    regressions = compare_with_baseline(results, load_results(BASELINE_FILE))
+    for [backend, num_steps, num_landmarks, metric, old, new] in regressions:
+        print "REGRESSION %s (steps = %d, landmarks = %d): %s went from %s to %s" % (backend, num_steps, num_landmarks, metric, old, new)
+    if len(regressions) > 0:
+        sys.exit(1)
+    print "No regressions against " + BASELINE_FILE
@@ -0,0 +1,165 @@
+'''
+Created on 22 Jan 2014
+
+Scores a SLAM run against the ground truth of a simulation, so we don't have to compare printed poses by eye.
+
+Trajectories are numpy arrays (or lists) with one [x, y, theta] row per step, landmarks have one [x, y, ...] row per
+landmark. Everything works on whole arrays at once, so scoring thousands of steps takes milliseconds.
+
+    - align_2d finds the rotation and translation which puts the estimated trajectory best on top of the true one
+      (least squares, Kabsch/Umeyama in 2D). SLAM only knows positions relative to where it started, so errors are
+      measured after this alignment.
+    - absolute trajectory error (ATE): distance between aligned estimated and true position at every step
+    - relative pose error (RPE): error in the motion between step i and step i + delta, in translation and rotation.
+      Does not need an alignment, and shows drift rather than the error accumulated since the start.
+    - landmark error: every true landmark gets the nearest (aligned) estimated landmark. Also counts true landmarks
+      without an estimate close enough (missed) and estimates which are nobody's nearest (spurious, usually duplicates).
+
+@author: Taghi
+'''
+
+import math
+import numpy
+from CommonFunctionality import normalize_angles
+
+def align_2d(estimated, truth):
+    '''
+    Returns [angle, translation] of the rigid transformation (rotation by angle, then adding translation) which
+    minimizes the squared distances between the transformed estimated positions and the true positions.
+    Only the first two columns of both arrays are used, they need the same number of rows.
+    '''
+    estimated = numpy.asarray(estimated, dtype = float)[:, 0:2]
+    truth = numpy.asarray(truth, dtype = float)[:, 0:2]
+    if len(estimated) == 0:
+        return [0.0, numpy.zeros(2)]
+
+    estimated_mean = estimated.mean(0)
+    truth_mean = truth.mean(0)
+    a = estimated - estimated_mean
+    b = truth - truth_mean
+
+    # In 2D the rotation of the Kabsch algorithm has a closed form: the angle between the summed dot and cross products
+    angle = math.atan2((a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0]).sum(), (a * b).sum())
+    translation = truth_mean - rotate(estimated_mean[numpy.newaxis], angle)[0]
+    return [angle, translation]
+
+def rotate(points, angle):
+    """ Rotates the first two columns of points by angle around the origin """
+    cos_a = math.cos(angle)
+    sin_a = math.sin(angle)
+    return numpy.column_stack([cos_a * points[:, 0] - sin_a * points[:, 1], sin_a * points[:, 0] + cos_a * points[:, 1]])
+
+def apply_alignment(points, alignment):
+    '''
+    Transforms points (poses or landmarks) with alignment = [angle, translation] from align_2d. Returns a new array;
+    a third column is taken to be an orientation and gets the angle added, further columns are copied.
+    '''
+    points = numpy.array(points, dtype = float)
+    if len(points) == 0:
+        return points
+    [angle, translation] = alignment
+    points[:, 0:2] = rotate(points, angle) + translation
+    if points.shape[1] > 2:
+        points[:, 2] = normalize_angles(points[:, 2] + angle)
+    return points
+
+def absolute_trajectory_error(estimated, truth, align = True):
+    '''
+    Returns the position error at every step, after aligning estimated to truth (see align_2d) if align is True.
+    '''
+    estimated = numpy.asarray(estimated, dtype = float)
+    truth = numpy.asarray(truth, dtype = float)
+    if align:
+        estimated = apply_alignment(estimated, align_2d(estimated, truth))
+    return numpy.sqrt(((estimated[:, 0:2] - truth[:, 0:2])**2).sum(1))
+
+def relative_motions(poses, delta = 1):
+    '''
+    Motions from pose i to pose i + delta, expressed in the frame of pose i: array of [forwards, sideways, dtheta]
+    '''
+    poses = numpy.asarray(poses, dtype = float)
+    start = poses[:-delta]
+    end = poses[delta:]
+    dx = end[:, 0] - start[:, 0]
+    dy = end[:, 1] - start[:, 1]
+    cos_t = numpy.cos(start[:, 2])
+    sin_t = numpy.sin(start[:, 2])
+    return numpy.column_stack([cos_t * dx + sin_t * dy, -sin_t * dx + cos_t * dy, normalize_angles(end[:, 2] - start[:, 2])])
+
+def relative_pose_error(estimated, truth, delta = 1):
+    '''
+    Compares the motion over delta steps of the estimate with the true motion over the same steps.
+    Returns [translation errors, rotation errors (absolute, radians)], one entry for every step i with i + delta in range.
+    '''
+    estimated_motions = relative_motions(estimated, delta)
+    true_motions = relative_motions(truth, delta)
+
+    # translation of tinv(true motion) composed with the estimated motion. A rotation doesn't change its length,
+    # so that is just the distance between both translations.
+    translation = numpy.sqrt(((estimated_motions[:, 0:2] - true_motions[:, 0:2])**2).sum(1))
+    rotation = numpy.abs(normalize_angles(estimated_motions[:, 2] - true_motions[:, 2]))
+    return [translation, rotation]
+
+def landmark_error(estimated_landmarks, true_landmarks, alignment = None, max_distance = None):
+    '''
+    Matches every true landmark to its nearest estimated landmark (after applying alignment, if given).
+
+    Returns [errors, missed, spurious] where
+        errors[j] = distance from true landmark j to its match, for the true landmarks which have a match
+        missed = number of true landmarks without an estimate within max_distance (None = any distance)
+        spurious = number of estimated landmarks which are not the match of any true landmark
+    '''
+    if len(true_landmarks) == 0:
+        return [numpy.zeros(0), 0, len(estimated_landmarks)]
+    if len(estimated_landmarks) == 0:
+        return [numpy.zeros(0), len(true_landmarks), 0]
+    estimated_landmarks = numpy.asarray(estimated_landmarks, dtype = float)
+    true_landmarks = numpy.asarray(true_landmarks, dtype = float)
+    if alignment is not None:
+        estimated_landmarks = apply_alignment(estimated_landmarks, alignment)
+
+    # (true, estimated) distance matrix. There are few landmarks compared to steps, so this stays small.
+    dx = true_landmarks[:, 0:1] - estimated_landmarks[:, 0]
+    dy = true_landmarks[:, 1:2] - estimated_landmarks[:, 1]
+    distances = numpy.sqrt(dx*dx + dy*dy)
+    nearest = distances.argmin(1)
+    errors = distances[numpy.arange(len(true_landmarks)), nearest]
+
+    matched = numpy.ones(len(true_landmarks), dtype = bool)
+    if max_distance is not None:
+        matched = errors <= max_distance
+    spurious = len(estimated_landmarks) - len(numpy.unique(nearest[matched]))
+    return [errors[matched], int((~matched).sum()), spurious]
+
+def evaluate(estimated_poses, true_poses, estimated_landmarks = None, true_landmarks = None, delta = 1, max_distance = None):
+    '''
+    All metrics of one run in a dict of floats: ATE (rmse, mean, max, final), RPE (translation and rotation rmse) and,
+    when landmarks are given, the landmark error (rmse, missed, spurious). Landmarks are aligned with the same
+    transformation as the trajectory.
+    '''
+    estimated_poses = numpy.asarray(estimated_poses, dtype = float)
+    true_poses = numpy.asarray(true_poses, dtype = float)
+    alignment = align_2d(estimated_poses, true_poses)
+
+    ate = absolute_trajectory_error(apply_alignment(estimated_poses, alignment), true_poses, align = False)
+    [rpe_translation, rpe_rotation] = relative_pose_error(estimated_poses, true_poses, delta)
+    metrics = {
+        "ate_rmse" : rms(ate),
+        "ate_mean" : float(ate.mean()) if len(ate) > 0 else 0.0,
+        "ate_max" : float(ate.max()) if len(ate) > 0 else 0.0,
+        "ate_final" : float(ate[-1]) if len(ate) > 0 else 0.0,
+        "rpe_translation_rmse" : rms(rpe_translation),
+        "rpe_rotation_rmse" : rms(rpe_rotation),
+    }
+    if estimated_landmarks is not None and true_landmarks is not None:
+        [errors, missed, spurious] = landmark_error(estimated_landmarks, true_landmarks, alignment, max_distance)
+        metrics["landmark_rmse"] = rms(errors)
+        metrics["landmarks_missed"] = missed
+        metrics["landmarks_spurious"] = spurious
+    return metrics
+
+def rms(values):
+    """ Root mean square of an array, 0.0 for an empty one """
+    if len(values) == 0:
+        return 0.0
+    return float(math.sqrt((values * values).mean()))
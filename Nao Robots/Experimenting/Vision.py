@@ -21,7 +21,7 @@ port = 9559
 #global visionProxy
 #resolution = 2    # VGA
 resolution = vision_definitions.kQVGA#kVGA #kQVGA  # QQVGA (160 * 120)
-colorSpace = 11   # RGB
+colorSpace = 11   # RGB, Vision(yuv422 = True) uses vision_definitions.kYUV422ColorSpace instead
 #colorSpace = vision_definitions. nt sure whats happening here
 logObj = Logger()
 motionObj = Motion()
@@ -33,11 +33,17 @@ RESW = 320#640#320 #160.0 #Capture width
 RESH = 240#480#240 #120.0 #Capture height
 FOVHOR = 46.40 #"horizontal" field of view
 FOVVER = 34.80 #"vertical" field of view
+SAVE_PICTURES = False # also save every picture as analyzeThis.png and show it, for debugging
 
 class Vision:
-    def __init__(self):
+    # yuv422: capture YUV422 pictures (2 bytes per pixel instead of 3), ImageProcessing classifies them directly
+    def __init__(self, yuv422 = False):
         self.visionProxy = ALProxy("ALVideoDevice", robotIp, port)
         self.motionProxy = ALProxy("ALMotion", robotIp, port)
+        self.frame = None
+        self.colorSpace = colorSpace
+        if yuv422:
+            self.colorSpace = vision_definitions.kYUV422ColorSpace
 
         pass
 
@@ -45,7 +51,7 @@ class Vision:
         action = 3
         motionObj.moveHeadPitch(0.3, 0.4)
         time.sleep(2)
-        videoClient = self.visionProxy.subscribeCamera("python_client", 0, resolution, colorSpace, 5)
+        videoClient = self.visionProxy.subscribeCamera("python_client", 0, resolution, self.colorSpace, 5)
         self.visionProxy.setCameraParameter(videoClient, 18, 0)
         picture = self.visionProxy.getImageRemote(videoClient)
         #picture2 = self.visionProxy.getImageLocal(videoClient)
@@ -53,17 +59,33 @@ class Vision:
         picWidth = picture[0]
         picHeight = picture[1]
         array = picture[6]
-        realPicture = Image.fromstring("RGB", (picWidth, picHeight), array)
-        realPicture.save("analyzeThis.png", "PNG")
+        if self.colorSpace == vision_definitions.kYUV422ColorSpace:
+            # Y U Y V for every 2 pixels: Y of every pixel, then U for even and V for odd columns
+            self.frame = np.frombuffer(array, dtype = np.uint8).reshape(picHeight, picWidth, 2)
+            if SAVE_PICTURES:
+                realPicture = Image.fromstring("L", (picWidth, picHeight), self.frame[:, :, 0].tostring())
+                realPicture.save("analyzeThis.png", "PNG")
+        else:
+            # keep the picture in memory as B, G, R like cv2 images, so image processing doesn't need a file
+            self.frame = np.ascontiguousarray(np.frombuffer(array, dtype = np.uint8).reshape(picHeight, picWidth, 3)[:, :, ::-1])
+            if SAVE_PICTURES:
+                realPicture = Image.fromstring("RGB", (picWidth, picHeight), array)
+                realPicture.save("analyzeThis.png", "PNG")
         time.sleep(2)
         cameraHeight = self.motionProxy.getTransform('CameraTop', 2, True)[11] #in meters
         angle = motionObj.measureAngle()
-        realPicture.show()
+        if SAVE_PICTURES:
+            realPicture.show()
         logObj.logWrite(time.time().__str__() + "_{0}".format(action))
         #logObj.logWrite(time.time().__str__() + "_5_{0}_0_0_0".format(name))
         return angle, cameraHeight
 
 
+    # last picture of takePic as numpy array of B, G, R bytes (rows x columns x 3),
+    # or Y and U/V bytes (rows x columns x 2) when capturing YUV422
+    def getFrame(self):
+        return self.frame
+
     #def analyze(self):
     #    logObj.logWrite(time.time().__str__() + "_6_0_0_0_0")
     #    pass
@@ -0,0 +1,152 @@
+'''
+Created on 12 Feb 2014
+
+Benchmark for the vision chain of ImageProcessing, on synthetic 320x240 pictures of the field (sky, green field with
+some noise, a yellow goalpost and an L corner of white lines).
+
+The brightness of every picture is a bit different, like it is on the robot when it walks around, so the light
+intensity Lic is different for every picture too. Anything in the chain which is cached per Lic gets no cache hits
+here and shows up in the timings.
+
+For both modes (startLumi, the full picture, and startScanlines, the sparse mode) we measure the median and slowest
+time per picture, from the ImageProcessing constructor to the result, the way Distance uses it. The full picture is
+also run with a high horizon (where the sky of the scene ends), with the rows above it skipped like Distance does.
+At the end it checks that the YUV422 versions of the pictures (see Vision) are classified like the pictures themselves:
+
+    python VisionBenchmark.py
+
+@author: Dennis
+'''
+
+import time
+import numpy
+
+import ImageProcessing as IP
+import Distance
+
+NUM_FRAMES = 50
+SEED = 1
+
+# Rows of the synthetic picture: sky above FIELD_ROW, the base of the goalpost at POST_BASE
+FIELD_ROW = 60
+POST_BASE = 130
+
+# Camera height (meters) of the high horizon case, the goalpost of the scene is about as long as it would be then
+CAMERA_HEIGHT = 0.5
+
+# How much darker or brighter (0-255) a picture can be than the one before
+MAX_BRIGHTNESS_CHANGE = 20
+
+# Part of the pixels that the YUV422 version of a picture should classify the same as the picture itself. Not all of
+# them: the camera shares U and V between two pixels and rounds Y, U and V, which moves colours at a class boundary
+MIN_YUV_AGREEMENT = 0.95
+
+# A picture should be done before the camera has the next one (30 frames per second)
+FRAME_BUDGET_MS = 33.0
+
+def make_scene(rng):
+    ''' Returns the BGR picture all frames are made from '''
+    img = numpy.zeros((240, 320, 3), dtype = numpy.uint8)
+    img[:] = (200, 120, 60)
+    img[FIELD_ROW:] = (30, 140, 40)
+    img[FIELD_ROW:] += rng.randint(0, 15, (240 - FIELD_ROW, 320, 3)).astype(numpy.uint8)
+    # L corner at (160, 150): a line to the right and a steep line down to the left
+    for x in xrange(160, 310):
+        y = int(150 + 0.15 * (x - 160))
+        img[y-2:y+3, x] = (250, 250, 250)
+    for y in xrange(150, 235):
+        x = int(160 - 0.4 * (y - 150))
+        img[y, x-3:x+4] = (250, 250, 250)
+    img[0:POST_BASE, 60:68] = (10, 200, 230)
+    return img
+
+def make_frames(num_frames = NUM_FRAMES, seed = SEED):
+    ''' Returns num_frames versions of the scene, every one with another brightness '''
+    rng = numpy.random.RandomState(seed)
+    scene = make_scene(rng).astype(numpy.int16)
+    brightness = numpy.cumsum(rng.randint(-MAX_BRIGHTNESS_CHANGE, MAX_BRIGHTNESS_CHANGE + 1, num_frames))
+    brightness = numpy.clip(brightness, -60, 60)
+    return [numpy.clip(scene + offset, 0, 255).astype(numpy.uint8) for offset in brightness]
+
+def bgr_to_yuv422(frame):
+    '''
+    The YUV422 picture (rows x cols x 2, see ColorTable.yuv422_to_yuv) the camera sends for the BGR picture frame, with
+    the same conversion as ColorTable.chroma_differences: U - 128 = (B - Y)/1.772, V - 128 = (R - Y)/1.402
+    '''
+    [B, G, R] = [frame[:, :, i].astype(float) for i in xrange(3)]
+    Y = 0.299 * R + 0.587 * G + 0.114 * B
+    U = 128 + (B - Y) / 1.772
+    V = 128 + (R - Y) / 1.402
+    yuv = numpy.empty(frame.shape[0:2] + (2,), dtype = numpy.uint8)
+    yuv[:, :, 0] = numpy.clip(numpy.round(Y), 0, 255)
+    # U of a pair of pixels in the even column, V in the odd one
+    yuv[:, 0::2, 1] = numpy.clip(numpy.round((U[:, 0::2] + U[:, 1::2]) / 2), 0, 255)
+    yuv[:, 1::2, 1] = numpy.clip(numpy.round((V[:, 0::2] + V[:, 1::2]) / 2), 0, 255)
+    return yuv
+
+def classified(frame):
+    ''' The picture after ImageProcessing.classifyImage, with the light intensity of the full picture mode '''
+    image = IP.ImageProcessing(frame)
+    image.setThreshold(120)
+    image.getAverageLightIntensity(image.getWidthImage(), image.getHeightImage(), image.img, 0.4)
+    image.classifyImage()
+    return image.img
+
+def check_yuv(num_frames = 10):
+    ''' Returns the lowest part of the pixels of a frame that are classified the same from YUV422 as from BGR '''
+    agreement = []
+    for frame in make_frames(num_frames):
+        same = (classified(frame) == classified(bgr_to_yuv422(frame))).all(2)
+        agreement.append(same.mean())
+    return min(agreement)
+
+def run_frame(frame, sparse, horizon = None):
+    '''
+    Runs one picture through ImageProcessing like Distance does, with the horizon at row horizon if it is given.
+    Returns [seconds, Lic, number of goalposts found]
+    '''
+    start = time.time()
+    image = IP.ImageProcessing(frame)
+    if horizon is not None:
+        margin = Distance.goalpostMargin(image.minYellow, CAMERA_HEIGHT) - Distance.HORIZON_MARGIN
+        image.setFieldTop(horizon - Distance.HORIZON_MARGIN, max(0, margin))
+    image.setThreshold(120)
+    if sparse:
+        image.getAverageLightIntensity(image.getWidthImage(), image.getHeightImage(), image.img, 0.05)
+        image.startScanlines()
+    else:
+        image.getAverageLightIntensity(image.getWidthImage(), image.getHeightImage(), image.img, 0.4)
+        image.startLumi()
+    return [time.time() - start, image.Lic, len(image.getGoalposts())]
+
+def run_benchmark(num_frames = NUM_FRAMES):
+    '''
+    Runs all modes on the same frames. Returns {mode : {"median_ms", "max_ms", "distinct_lic", "goalpost_found"}},
+    goalpost_found is the part of the frames in which the goalpost was found.
+    The first frame of every mode is not counted, it may have to make the colour tables.
+    '''
+    frames = make_frames(num_frames + 1)
+    results = {}
+    for (mode, sparse, horizon) in [("full", False, None), ("scanlines", True, None), ("high horizon", False, FIELD_ROW)]:
+        run_frame(frames[0], sparse, horizon)
+        measured = [run_frame(frame, sparse, horizon) for frame in frames[1:]]
+        times = numpy.array([seconds for [seconds, Lic, goalposts] in measured]) * 1000
+        results[mode] = {"median_ms" : float(numpy.median(times)), "max_ms" : float(times.max()),
+                         "distinct_lic" : len(set(Lic for [seconds, Lic, goalposts] in measured)),
+                         "goalpost_found" : numpy.mean([goalposts == 1 for [seconds, Lic, goalposts] in measured])}
+    return results
+
+if __name__ == "__main__":
+    results = run_benchmark()
+    for mode in sorted(results.keys()):
+        result = results[mode]
+        print mode + ": median " + ("%.1f" % result["median_ms"]) + " ms, slowest " + ("%.1f" % result["max_ms"]) + \
+              " ms, " + str(result["distinct_lic"]) + " different values of Lic, goalpost found in " + \
+              ("%.0f" % (100 * result["goalpost_found"])) + "% of the frames"
+        if result["median_ms"] > FRAME_BUDGET_MS:
+            print "    SLOWER THAN " + str(FRAME_BUDGET_MS) + " ms PER FRAME"
+
+    agreement = check_yuv()
+    print "yuv422: at least " + ("%.1f" % (100 * agreement)) + "% of the pixels classified like in the BGR picture"
+    if agreement < MIN_YUV_AGREEMENT:
+        print "    LESS THAN " + str(100 * MIN_YUV_AGREEMENT) + "%"